@@ -0,0 +1,133 @@
+from time import perf_counter
+from typing import Dict, Tuple
+
+from engine.blocks import Block
+from engine.game import Game
+from engine.schedule import KEY_LEFT, KEY_RIGHT, KEY_UP
+
+ACTIONS = (None, KEY_LEFT, KEY_RIGHT, KEY_UP)
+DEAD = -1_000_000
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class Autopilot:
+    # Picks the key to press by searching a few iterations ahead on the game itself: every step is applied
+    # with `Game.apply` and taken back with `Game.undo`, which only replays what the step changed. A step is one
+    # key followed by an iteration without new or destroyed blocks, the depth grows until the time budget runs
+    # out. A key that changes nothing leads where no key does and is not searched again. Values of searched
+    # positions are kept by the board's Zobrist hash, so a position reached again, by another order of keys or
+    # in a later decision, is not simulated twice.
+    def __init__(self, game: Game, budget=0.004, max_depth=8, max_table_size=200_000):
+        self.game = game
+        self.budget = budget
+        self.max_depth = max_depth
+        self.max_table_size = max_table_size
+        # position hash -> (depth it was searched to, value)
+        self.table: Dict[int, Tuple[int, int]] = {}
+        self.deadline = 0.0
+        self.nodes = 0
+        self.depth_reached = 0
+        game.board.enable_hashing(game.seed)
+
+    def press(self, key: str | None):
+        player = self.game.player
+        if key == KEY_LEFT:
+            player.move_x(-1)
+        elif key == KEY_RIGHT:
+            player.move_x(1)
+        elif key == KEY_UP:
+            player.move_y(-1)
+
+    def step(self, key: str | None) -> bool:
+        # applies the key and the iteration after it, False (and nothing applied) for a key that changes nothing
+        game = self.game
+        if key is not None:
+            position = game.board.hash
+            game.apply(self.press, key)
+            if game.board.hash == position:
+                game.undo()
+                return False
+        game.apply(game.next_iteration)
+        return True
+
+    def take_back(self, key: str | None):
+        self.game.undo()
+        if key is not None:
+            self.game.undo()
+
+    def evaluate(self) -> int:
+        # The player does not hold anything up, so the first block above it comes down on it unless the block
+        # rests on something else; such a block is a roof against whatever falls later. Free sides are a way out.
+        board = self.game.board
+        player = self.game.player
+        score = 0
+        for y in range(player.y - 1, -1, -1):
+            cell_value = board.read_cell(player.x, y)
+            if isinstance(cell_value, Block):
+                score = -1000 // (player.y - y) if board.can_block_be_moved(cell_value, 0, 1) else 20
+                break
+        score += 3 * board.is_cell_free(player.x - 1, player.y) + 3 * board.is_cell_free(player.x + 1, player.y)
+        return score
+
+    def search(self, depth: int) -> int:
+        game = self.game
+        if game.player.is_dead():
+            # the sooner, the worse
+            return DEAD - depth
+        if depth == 0:
+            return self.evaluate()
+
+        key = game.board.hash
+        entry = self.table.get(key)
+        if entry is not None and entry[0] >= depth:
+            return entry[1]
+
+        self.nodes += 1
+        best = 2 * DEAD
+        for action in ACTIONS:
+            # before every step, a step costs less than a node by the number of keys
+            if perf_counter() > self.deadline:
+                raise SearchTimeout()
+            if not self.step(action):
+                continue
+            try:
+                best = max(best, self.search(depth - 1))
+            finally:
+                self.take_back(action)
+        self.table[key] = (depth, best)
+        return best
+
+    def choose(self) -> str | None:
+        game = self.game
+        if game.player.is_dead():
+            return None
+        self.deadline = perf_counter() + self.budget
+        if len(self.table) > self.max_table_size:
+            self.table.clear()
+
+        best_action = None
+        self.depth_reached = 0
+        # the search ends where it started, nobody needs to hear about the steps on the way
+        board = game.board
+        changes, board.changes = board.changes, None
+        try:
+            for depth in range(1, self.max_depth + 1):
+                values = {}
+                for action in ACTIONS:
+                    if not self.step(action):
+                        continue
+                    try:
+                        values[action] = self.search(depth - 1)
+                    finally:
+                        self.take_back(action)
+                # on a tie the first action wins, doing nothing comes first
+                best_action = max(values, key=values.__getitem__)
+                self.depth_reached = depth
+        except SearchTimeout:
+            pass
+        finally:
+            board.changes = changes
+        return best_action
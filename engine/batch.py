@@ -0,0 +1,314 @@
+from typing import Sequence
+
+import numpy as np
+
+from engine.blocks import ALL_BLOCKS
+from engine.board import BLOCK_KINDS, EMPTY_CELL, PLAYER_CELL, Board
+from engine.game import POSSIBLE_BLOCKS, Game
+
+# The shapes of all block kinds (engine.board.BLOCK_KINDS) as tables indexed by kind, (x, y) offsets one row each.
+# Shapes with fewer cells than a table is wide repeat their first one, which writes or checks that cell twice.
+KIND_COUNT = max(BLOCK_KINDS.values()) + 1
+CELLS_PER_SHAPE = max(len(block_type.shape.offsets) for block_type in ALL_BLOCKS)
+EDGES_PER_SHAPE = max(len(block_type.shape.edges[direction]) for block_type in ALL_BLOCKS
+                      for direction in ((0, 1), (0, -1)))
+SHAPE_CELLS = np.zeros((KIND_COUNT, 2, CELLS_PER_SHAPE), np.int64)
+# the bottom and the top edge, cells with no cell of the same shape right below or above them
+SHAPE_BOTTOM_EDGES = np.zeros((KIND_COUNT, 2, EDGES_PER_SHAPE), np.int64)
+SHAPE_TOP_EDGES = np.zeros((KIND_COUNT, 2, EDGES_PER_SHAPE), np.int64)
+SHAPE_SIZES = np.zeros(KIND_COUNT, np.int64)
+SHAPE_WIDTHS = np.zeros(KIND_COUNT, np.int64)
+SHAPE_BOTTOM_RIGHT = np.zeros((KIND_COUNT, 2), np.int64)
+for _block_type, _kind in BLOCK_KINDS.items():
+    _shape = _block_type.shape
+    for _table, _cells, _width in ((SHAPE_CELLS, _shape.offsets, CELLS_PER_SHAPE),
+                                   (SHAPE_BOTTOM_EDGES, _shape.edges[0, 1], EDGES_PER_SHAPE),
+                                   (SHAPE_TOP_EDGES, _shape.edges[0, -1], EDGES_PER_SHAPE)):
+        _table[_kind] = np.array(_cells + _cells[:1] * (_width - len(_cells))).T
+    SHAPE_SIZES[_kind] = len(_shape.offsets)
+    SHAPE_WIDTHS[_kind] = _shape.width
+    SHAPE_BOTTOM_RIGHT[_kind] = _shape.bottom_right
+SPAWN_KINDS = np.array([BLOCK_KINDS[block_type] for block_type in POSSIBLE_BLOCKS], np.int64)
+
+# what `owners` holds for a cell: no block, the player or the slot + 1 of the block in it
+NO_OWNER = 0
+PLAYER_OWNER = -1
+
+
+class BatchGame:
+    # Steps N independent games with one call per step for all of them. The games are slices of the same NumPy
+    # arrays, and a step is a fixed number of array operations over the blocks taking part in it, not a loop over
+    # the games.
+    # Cells are (N, max_y, max_x): `owners` tells which block slot fills a cell, `cells` holds its kind
+    # (engine.board.cell_kind) and is what observations read. Blocks are (N, slots): `block_kinds` (0 for a free
+    # slot), `block_x`, `block_y`, `still` (age_not_in_motion) and `falling` (Board.falling); `resting_cells`
+    # counts the cells of the resting blocks of every game.
+    # The rules are those of engine.game.Game, whose starting boards the games get. The random draws come from
+    # one generator for the whole batch, so game `i` plays like `Game(seed=seeds[i])` statistically, not draw
+    # for draw, and a batch with the same seeds always plays the same.
+    # A game is `alive` until `end_games`, which does what the GameEnd of the next Schedule.next_frame does: until
+    # then a game whose player was crushed (`crushed`, Player.is_dead) still steps, only its player keeps still.
+    def __init__(self, n: int, max_x=16, max_y=16, seeds: Sequence[int] | None = None, board_type=Board,
+                 pool=None):
+        seeds = list(seeds) if seeds is not None else list(range(n))
+        if len(seeds) != n:
+            raise ValueError(f'{len(seeds)} seeds for a batch of {n} games.')
+        games = [Game(max_x, max_y, board_type, seed=seed, pool=pool) for seed in seeds]
+        self.n = n
+        self.upper_lines = games[0].upper_lines if n else 4
+        self.max_x = max_x
+        self.max_y = max_y + self.upper_lines
+        self.cells_per_game = self.max_x * self.max_y
+        # blocks never overlap, so a board cannot hold more blocks than this
+        self.slots = self.cells_per_game // int(SHAPE_SIZES[SPAWN_KINDS].min()) + 1
+        self.random = np.random.default_rng([game.seed for game in games])
+
+        self.owners = np.zeros((n, self.max_y, self.max_x), np.int64)
+        self.cells = np.zeros((n, self.max_y, self.max_x), np.uint8)
+        self.block_kinds = np.zeros((n, self.slots), np.int64)
+        self.block_x = np.zeros((n, self.slots), np.int64)
+        self.block_y = np.zeros((n, self.slots), np.int64)
+        self.still = np.zeros((n, self.slots), np.int64)
+        self.falling = np.zeros((n, self.slots), bool)
+        self.resting_cells = np.zeros(n, np.int64)
+        self.player_x = np.zeros(n, np.int64)
+        self.player_y = np.zeros(n, np.int64)
+        self.alive = np.ones(n, bool)
+        self.crushed = np.zeros(n, bool)
+        self.current_iteration = np.zeros(n, np.int64)
+        self.blocks_eaten = np.zeros(n, np.int64)
+        for i, game in enumerate(games):
+            self.read_game(i, game)
+
+        # flat views, a cell is `game * cells_per_game + y * max_x + x` and a block `game * slots + slot`
+        self.flat_owners = self.owners.reshape(-1)
+        self.flat_cells = self.cells.reshape(-1)
+        self.flat_kinds = self.block_kinds.reshape(-1)
+        self.flat_x = self.block_x.reshape(-1)
+        self.flat_y = self.block_y.reshape(-1)
+        self.flat_still = self.still.reshape(-1)
+        self.flat_falling = self.falling.reshape(-1)
+
+    def read_game(self, i: int, game: Game):
+        # copies the board of `game` into game `i` of the batch
+        board = game.board
+        for slot, block in enumerate(board.blocks):
+            kind = BLOCK_KINDS[type(block)]
+            self.block_kinds[i, slot] = kind
+            self.block_x[i, slot], self.block_y[i, slot] = block.x, block.y
+            self.still[i, slot] = block.age_not_in_motion
+            self.falling[i, slot] = block in board.falling
+            for x, y in block.shape.cells(block.x, block.y):
+                self.owners[i, y, x] = slot + 1
+                self.cells[i, y, x] = kind
+        self.resting_cells[i] = board.resting.cell_count
+        player = game.player
+        self.player_x[i], self.player_y[i] = player.x, player.y
+        self.owners[i, player.y, player.x] = PLAYER_OWNER
+        self.cells[i, player.y, player.x] = PLAYER_CELL
+        self.current_iteration[i] = game.current_iteration
+
+    def board_cells(self, i: int, first_row: int = 0) -> np.ndarray:
+        # zero-copy (rows, max_x) view of game `i`, `cells[i, y, x]` reads single cells across the batch
+        return self.cells[i, first_row:]
+
+    def visible_cells(self, i: int) -> np.ndarray:
+        # what the front-ends would draw for game `i`
+        return self.board_cells(i, self.upper_lines)
+
+    def is_dead(self, i: int) -> bool:
+        return bool(self.crushed[i])
+
+    def end_games(self):
+        self.alive &= ~self.crushed
+
+    def stepping(self, mask: Sequence[bool] | None) -> np.ndarray:
+        # the games a step is for: those alive, and in `mask` when given
+        return self.alive if mask is None else self.alive & np.asarray(mask, bool)
+
+    def block_order(self, blocks: np.ndarray) -> np.ndarray:
+        # Game.gravity_order as one number, the higher the sooner the gravity settles a block
+        kinds = self.flat_kinds[blocks]
+        return ((self.flat_y[blocks] + SHAPE_BOTTOM_RIGHT[kinds, 1]) * self.max_x
+                + self.flat_x[blocks] + SHAPE_BOTTOM_RIGHT[kinds, 0])
+
+    def shape_cells(self, blocks: np.ndarray, table: np.ndarray, dy=0) -> np.ndarray:
+        # flat cells of `table` (SHAPE_CELLS or an edge) of every block, moved down by `dy`, one row per block;
+        # -1 for a cell above or below the board
+        kinds = self.flat_kinds[blocks]
+        x = self.flat_x[blocks][:, None] + table[kinds, 0]
+        y = self.flat_y[blocks][:, None] + table[kinds, 1] + dy
+        cells = (blocks // self.slots)[:, None] * self.cells_per_game + y * self.max_x + x
+        return np.where((y >= 0) & (y < self.max_y), cells, -1)
+
+    def owner_blocks(self, cells: np.ndarray) -> np.ndarray:
+        # flat block in each of `cells`, -1 for an empty cell, the player or a cell off the board
+        owners = np.where(cells >= 0, self.flat_owners[cells], NO_OWNER)
+        return np.where(owners > NO_OWNER, cells // self.cells_per_game * self.slots + owners - 1, -1)
+
+    def write_blocks(self, blocks: np.ndarray):
+        # puts the blocks into their cells, a player in one of them is crushed, as on a Board
+        cells = self.shape_cells(blocks, SHAPE_CELLS)
+        crushed = (self.flat_owners[cells] == PLAYER_OWNER).any(axis=1)
+        self.crushed[blocks[crushed] // self.slots] = True
+        self.flat_owners[cells] = (blocks % self.slots + 1)[:, None]
+        self.flat_cells[cells] = self.flat_kinds[blocks][:, None]
+
+    def clear_blocks(self, blocks: np.ndarray):
+        cells = self.shape_cells(blocks, SHAPE_CELLS)
+        self.flat_owners[cells] = NO_OWNER
+        self.flat_cells[cells] = EMPTY_CELL
+
+    def remove_blocks(self, blocks: np.ndarray):
+        # Board.remove_object_in_cell: the blocks resting on any of their cells might fall now
+        self.clear_blocks(blocks)
+        above = self.owner_blocks(self.shape_cells(blocks, SHAPE_CELLS, -1))
+        self.flat_falling[above[above >= 0]] = True
+        resting = blocks[self.flat_still[blocks] > 0]
+        np.subtract.at(self.resting_cells, resting // self.slots, SHAPE_SIZES[self.flat_kinds[resting]])
+        self.flat_kinds[blocks] = 0
+        self.flat_falling[blocks] = False
+
+    def next_iteration(self, mask: Sequence[bool] | None = None):
+        # Game.next_iteration for every game that is stepping. Blocks are settled in the order of their lowest
+        # right-most cell, bottom-up, and a block falls when every cell right below it is free (the player does
+        # not count) or holds a block settled before it that falls too. Moving a block down only ever frees cells,
+        # so this is what settling them one by one finds; the falling blocks then all move at once.
+        # Like Game, this only settles the falling blocks and the ones a falling block leaves behind: those that
+        # come after it this iteration, the others in the next one.
+        stepping = self.stepping(mask)
+        self.current_iteration[stepping] += 1
+        new = np.flatnonzero(self.flat_falling & np.repeat(stepping, self.slots))
+        self.flat_falling[new] = False
+        order = np.zeros(len(self.flat_kinds), np.int64)
+        falls = np.zeros(len(self.flat_kinds), bool)
+        is_checked = np.zeros(len(self.flat_kinds), bool)
+        checked, woken_before = [], []
+        # the checked blocks that do not fall yet, with the cells right below them and the blocks in those
+        waiting = np.empty(0, np.int64)
+        free = np.empty((0, EDGES_PER_SHAPE), bool)
+        supports = np.empty((0, EDGES_PER_SHAPE), np.int64)
+        while len(new):
+            checked.append(new)
+            is_checked[new] = True
+            order[new] = self.block_order(new)
+            below = self.shape_cells(new, SHAPE_BOTTOM_EDGES, 1)
+            waiting = np.concatenate((waiting, new))
+            free = np.concatenate((free, (below >= 0) & (self.flat_owners[below] <= NO_OWNER)))
+            supports = np.concatenate((supports, self.owner_blocks(below)))
+
+            fallers = []
+            while len(waiting):
+                # a support has to be settled before the block, only a checked one has an order and can fall
+                now = (free | (supports >= 0) & falls[supports]
+                       & (order[supports] > order[waiting][:, None])).all(axis=1)
+                if not now.any():
+                    break
+                fallers.append(waiting[now])
+                falls[waiting[now]] = True
+                waiting, free, supports = waiting[~now], free[~now], supports[~now]
+            if not fallers:
+                break
+
+            # the blocks right above the cells a falling block leaves, settled after it or in the next iteration
+            fallers = np.concatenate(fallers)
+            above = self.owner_blocks(self.shape_cells(fallers, SHAPE_TOP_EDGES, -1))
+            wakers = np.broadcast_to(fallers[:, None], above.shape)[above >= 0]
+            above = above[above >= 0]
+            after = self.block_order(above) < order[wakers]
+            woken_before.append(above[~after])
+            new = np.unique(above[after & ~is_checked[above]])
+
+        checked = np.concatenate(checked) if checked else np.empty(0, np.int64)
+        moving = falls[checked]
+        resting = self.flat_still[checked] > 0
+        # resting blocks that fall stop resting, the others that stay start to
+        changed = moving == resting
+        np.add.at(self.resting_cells, checked[changed] // self.slots,
+                  np.where(moving[changed], -1, 1) * SHAPE_SIZES[self.flat_kinds[checked[changed]]])
+        self.flat_still[checked] = np.where(moving, 0, self.flat_still[checked] + 1)
+        fallers = checked[moving]
+        self.clear_blocks(fallers)
+        self.flat_y[fallers] += 1
+        self.write_blocks(fallers)
+        self.flat_falling[fallers] = True
+        for woken in woken_before:
+            self.flat_falling[woken] = True
+
+    def generate_new_block(self, mask: Sequence[bool] | None = None):
+        # Game.generate_new_block for every game that is stepping: a random kind at a random x of the top row, or
+        # where it fits if that spot is taken, nothing when it fits nowhere; the player does not count
+        games = np.flatnonzero(self.stepping(mask))
+        if not len(games):
+            return
+        kinds = SPAWN_KINDS[self.random.integers(len(SPAWN_KINDS), size=len(games))]
+        x = (self.random.random(len(games)) * (self.max_x - SHAPE_WIDTHS[kinds] + 1)).astype(np.int64)
+
+        def taken(games: np.ndarray, kinds: np.ndarray, x: np.ndarray) -> np.ndarray:
+            # whether a block of `kinds` with its origin at (x, 0) would cover a block, for any shape of arrays
+            cells = (games[..., None] * self.cells_per_game + SHAPE_CELLS[kinds, 1] * self.max_x
+                     + np.minimum(x[..., None] + SHAPE_CELLS[kinds, 0], self.max_x - 1))
+            return (self.flat_owners[cells] > NO_OWNER).any(axis=-1)
+
+        elsewhere = np.flatnonzero(taken(games, kinds, x))
+        if len(elsewhere):
+            # any other spot where the block fits is as good
+            spots = np.broadcast_to(np.arange(self.max_x), (len(elsewhere), self.max_x))
+            other_games = np.broadcast_to(games[elsewhere][:, None], spots.shape)
+            other_kinds = np.broadcast_to(kinds[elsewhere][:, None], spots.shape)
+            fits = (spots + SHAPE_WIDTHS[other_kinds] <= self.max_x) & ~taken(other_games, other_kinds, spots)
+            counts = fits.sum(axis=1)
+            nth = (self.random.random(len(elsewhere)) * counts).astype(np.int64)
+            x[elsewhere] = (fits.cumsum(axis=1) > nth[:, None]).argmax(axis=1)
+            placed = np.ones(len(games), bool)
+            placed[elsewhere[counts == 0]] = False
+            games, kinds, x = games[placed], kinds[placed], x[placed]
+
+        blocks = games * self.slots + (self.block_kinds[games] == 0).argmax(axis=1)
+        self.flat_kinds[blocks] = kinds
+        self.flat_x[blocks] = x
+        self.flat_y[blocks] = 0
+        self.flat_still[blocks] = 0
+        self.flat_falling[blocks] = True
+        self.write_blocks(blocks)
+
+    def destroy_static_block(self, mask: Sequence[bool] | None = None):
+        # Game.destroy_static_block for every game that is stepping: a block goes as often as probing a random cell
+        # would hit a resting one, and which one goes is drawn uniformly from the resting blocks
+        probes = (self.random.random(self.n) * self.cells_per_game).astype(np.int64)
+        games = np.flatnonzero(self.stepping(mask) & (probes < self.resting_cells))
+        blocks = []
+        # slots drawn uniformly until they hold a resting block, about slots / resting blocks draws
+        while len(games):
+            drawn = games * self.slots + self.random.integers(self.slots, size=len(games))
+            hit = (self.flat_kinds[drawn] > 0) & (self.flat_still[drawn] > 0)
+            blocks.append(drawn[hit])
+            games = games[~hit]
+        if blocks:
+            self.remove_blocks(np.concatenate(blocks))
+
+    def move_players(self, dx: Sequence[int], dy: Sequence[int]):
+        # One move per game like Player.move_x/move_y: (dx, 0) for -1 or 1 eats the block there and steps aside,
+        # (0, -1) eats the block above and climbs, (0, 1) falls when nothing is below, (0, 0) is no move.
+        dx, dy = np.asarray(dx, np.int64), np.asarray(dy, np.int64)
+        dy = np.where(dx != 0, 0, dy)
+        games = np.flatnonzero(self.alive & ~self.crushed & ((dx != 0) | (dy != 0)))
+        to_x, to_y = self.player_x[games] + dx[games], self.player_y[games] + dy[games]
+        on_board = (to_x >= 0) & (to_x < self.max_x) & (to_y >= 0) & (to_y < self.max_y)
+        games, to_x, to_y = games[on_board], to_x[on_board], to_y[on_board]
+
+        to = games * self.cells_per_game + to_y * self.max_x + to_x
+        blocks = self.owner_blocks(to)
+        # a block below stops a fall, it is not eaten
+        eats = (blocks >= 0) & (dy[games] <= 0)
+        self.remove_blocks(blocks[eats])
+        self.blocks_eaten[games[eats]] += 1
+        moves = (blocks < 0) | eats
+        games, to, to_x, to_y = games[moves], to[moves], to_x[moves], to_y[moves]
+
+        at = games * self.cells_per_game + self.player_y[games] * self.max_x + self.player_x[games]
+        self.flat_owners[at] = NO_OWNER
+        self.flat_cells[at] = EMPTY_CELL
+        self.flat_owners[to] = PLAYER_OWNER
+        self.flat_cells[to] = PLAYER_CELL
+        self.player_x[games], self.player_y[games] = to_x, to_y
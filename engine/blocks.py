@@ -1,81 +1,155 @@
-from typing import List
+from typing import Dict, List, Tuple
 
 from engine.point import Point2D
 
+Offset = Tuple[int, int]
+
+
+class Shape:
+    # Immutable template shared by every block of one type: cell offsets from the block origin plus
+    # everything the board needs to move it, so a block itself is just an origin and a shape.
+    __slots__ = ('offsets', 'edges', 'column_edges', 'rows', 'columns', 'bottom_right', 'width', 'height')
+
+    def __init__(self, *offsets: Offset):
+        self.offsets: Tuple[Offset, ...] = offsets
+        # cells that run into new board cells when moving by (dx, dy), e.g. the bottom edge for (0, 1)
+        self.edges: Dict[Offset, Tuple[Offset, ...]] = {
+            direction: self.leading_edge(*direction) for direction in ((0, 1), (1, 0), (-1, 0), (0, -1))
+        }
+        # the same edges as bitmasks of rows per column, as (dx, mask) pairs
+        self.column_edges: Dict[Offset, Tuple[Offset, ...]] = {
+            direction: self.column_masks(edge) for direction, edge in self.edges.items()
+        }
+        # bitmask of the occupied columns of every row, as (dy, mask) pairs
+        self.rows: Tuple[Offset, ...] = tuple(
+            (dy, sum(1 << dx for dx, other_dy in offsets if other_dy == dy))
+            for dy in sorted({dy for _, dy in offsets})
+        )
+        # bitmask of the occupied rows of every column, as (dx, mask) pairs
+        self.columns: Tuple[Offset, ...] = tuple(
+            (dx, sum(1 << dy for other_dx, dy in offsets if other_dx == dx))
+            for dx in sorted({dx for dx, _ in offsets})
+        )
+        # the lowest right-most cell, it decides the gravity order of a block
+        self.bottom_right: Offset = max(offsets, key=lambda offset: (offset[1], offset[0]))
+        self.width = max(dx for dx, _ in offsets) + 1
+        self.height = max(dy for _, dy in offsets) + 1
+
+    def leading_edge(self, dx: int, dy: int) -> Tuple[Offset, ...]:
+        return tuple((x, y) for x, y in self.offsets if (x + dx, y + dy) not in self.offsets)
+
+    def edge(self, dx: int, dy: int) -> Tuple[Offset, ...]:
+        edge = self.edges.get((dx, dy))
+        return edge if edge is not None else self.leading_edge(dx, dy)
+
+    @staticmethod
+    def column_masks(offsets: Tuple[Offset, ...]) -> Tuple[Offset, ...]:
+        return tuple((dx, sum(1 << dy for other_dx, dy in offsets if other_dx == dx))
+                     for dx in sorted({dx for dx, _ in offsets}))
+
+    def column_edge(self, dx: int, dy: int) -> Tuple[Offset, ...]:
+        edge = self.column_edges.get((dx, dy))
+        return edge if edge is not None else self.column_masks(self.leading_edge(dx, dy))
+
+    def cells(self, x: int, y: int) -> List[Offset]:
+        return [(x + dx, y + dy) for dx, dy in self.offsets]
+
 
 class Block:
+    __slots__ = ('x', 'y', 'char', 'age', 'age_not_in_motion')
+    shape = Shape((0, 0))
+
     def __init__(self, x: int, y: int, char: str = 'X'):
-        self.location: List[Point2D | None] = [Point2D(x, y)]
+        # origin of the shape, moving a block only changes these two
+        self.x = x
+        self.y = y
         self.char = char
         self.age = 0
         self.age_not_in_motion = 0
 
+    @property
+    def location(self) -> List[Point2D]:
+        return [Point2D(x, y) for x, y in self.shape.cells(self.x, self.y)]
+
+    def copy(self) -> 'Block':
+        block = object.__new__(type(self))
+        block.x, block.y, block.char = self.x, self.y, self.char
+        block.age, block.age_not_in_motion = self.age, self.age_not_in_motion
+        return block
+
 
 class PointBlock(Block):
+    __slots__ = ()
+
     def __init__(self, x: int, y: int, char='P'):
         super().__init__(x, y, char=char)
-        self.location: List[Point2D] = [Point2D(x, y)]
 
 
 class HorizontalLine4Block(Block):
     # this block is not present in the original Kret
+    __slots__ = ()
+    shape = Shape((0, 0), (1, 0), (2, 0), (3, 0))
+
     def __init__(self, x: int, y: int, char='L'):
         super().__init__(x, y, char=char)
-        self.location: List[Point2D] = [Point2D(x, y),
-                                        Point2D(x + 1, y),
-                                        Point2D(x + 2, y),
-                                        Point2D(x + 3, y)]
 
 
 class VerticalLine4Block(Block):
+    __slots__ = ()
+    shape = Shape((0, 0), (0, 1), (0, 2), (0, 3))
+
     def __init__(self, x: int, y: int, char='L'):
         super().__init__(x, y, char=char)
-        self.location: List[Point2D] = [Point2D(x, y),
-                                        Point2D(x, y + 1),
-                                        Point2D(x, y + 2),
-                                        Point2D(x, y + 3)]
 
 
 class TBlock1(Block):
+    __slots__ = ()
+    shape = Shape((0, 0), (1, 0), (2, 0), (1, 1))
+
     def __init__(self, x: int, y: int, char='R'):
         super().__init__(x, y, char=char)
-        self.location: List[Point2D] = [Point2D(x, y),
-                                        Point2D(x + 1, y),
-                                        Point2D(x + 2, y),
-                                        Point2D(x + 1, y + 1)]
 
 
 class SHorizontalBlock(Block):
+    __slots__ = ()
+    shape = Shape((1, 0), (2, 0), (0, 1), (1, 1))
+
     def __init__(self, x: int, y: int, char='S'):
         super().__init__(x, y, char=char)
-        self.location: List[Point2D] = [Point2D(x + 1, y),
-                                        Point2D(x + 2, y),
-                                        Point2D(x, y + 1),
-                                        Point2D(x + 1, y + 1)]
 
 
 class SVerticalBlock(Block):
+    __slots__ = ()
+    shape = Shape((0, 0), (0, 1), (1, 1), (1, 2))
+
     def __init__(self, x: int, y: int, char='S'):
         super().__init__(x, y, char=char)
-        self.location: List[Point2D] = [Point2D(x, y),
-                                        Point2D(x, y + 1),
-                                        Point2D(x + 1, y + 1),
-                                        Point2D(x + 1, y + 2)]
 
 
 class ZHorizontalBlock(Block):
+    __slots__ = ()
+    shape = Shape((0, 0), (1, 0), (1, 1), (2, 1))
+
     def __init__(self, x: int, y: int, char='Z'):
         super().__init__(x, y, char=char)
-        self.location: List[Point2D] = [Point2D(x, y),
-                                        Point2D(x + 1, y),
-                                        Point2D(x + 1, y + 1),
-                                        Point2D(x + 2, y + 1)]
 
 
 class ZVerticalBlock(Block):
+    __slots__ = ()
+    shape = Shape((1, 0), (0, 1), (1, 1), (0, 2))
+
     def __init__(self, x: int, y: int, char='Z'):
         super().__init__(x, y, char=char)
-        self.location: List[Point2D] = [Point2D(x + 1, y),
-                                        Point2D(x, y + 1),
-                                        Point2D(x + 1, y + 1),
-                                        Point2D(x, y + 2)]
+
+
+ALL_BLOCKS = (
+    Block,
+    PointBlock,
+    HorizontalLine4Block,
+    VerticalLine4Block,
+    TBlock1,
+    SHorizontalBlock,
+    SVerticalBlock,
+    ZHorizontalBlock,
+    ZVerticalBlock,
+)
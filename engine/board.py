@@ -1,16 +1,151 @@
+from itertools import chain
+from random import Random
 from types import NoneType
-from typing import List, Tuple
+from typing import Callable, Dict, Iterable, List, Set, Tuple
 
-from engine.blocks import Block
+from engine.blocks import ALL_BLOCKS, Block, Offset, Shape
+from engine.changes import ChangeLog
 from engine.player import Player
-from engine.point import Point2D
+
+# compact cell codes shared by the array based parts of the engine
+EMPTY_CELL = 0
+PLAYER_CELL = 1
+BLOCK_KINDS = {block_type: kind for kind, block_type in enumerate(ALL_BLOCKS, start=2)}
+BLOCK_TYPES = {kind: block_type for block_type, kind in BLOCK_KINDS.items()}
+
+
+def cell_kind(cell_value: Block | Player | None) -> int:
+    if cell_value is None:
+        return EMPTY_CELL
+    if isinstance(cell_value, Player):
+        return PLAYER_CELL
+    return BLOCK_KINDS[type(cell_value)]
+
+
+class RestingBlocks:
+    # Blocks that did not move in their last iteration (age_not_in_motion > 0). They are kept in a list, so
+    # drawing one uniformly is O(1), with their positions in it, so removing one (swapped with the last) is
+    # O(1) too, `rows[y]` counts those with a cell in row y and `cell_count` the cells of all of them. Resting
+    # blocks do not move, so the counts stay right until a block is discarded. The order only depends on the
+    # order of the calls, which keeps seeded games reproducible.
+    def __init__(self, max_y: int):
+        self.blocks: List[Block] = []
+        self.positions: Dict[Block, int] = {}
+        self.rows: List[int] = [0] * max_y
+        self.cell_count = 0
+        # the board's journal, see Board.start_journal
+        self.journal: List[tuple] | None = None
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __iter__(self):
+        return iter(self.blocks)
+
+    def __contains__(self, block: Block):
+        return block in self.positions
+
+    def add(self, block: Block):
+        if block in self.positions:
+            return
+        self.positions[block] = len(self.blocks)
+        self.blocks.append(block)
+        self.cell_count += len(block.shape.offsets)
+        rows = self.rows
+        for dy, _ in block.shape.rows:
+            rows[block.y + dy] += 1
+        if self.journal is not None:
+            self.journal.append((self.take_back, block))
+
+    def take_back(self, block: Block):
+        # undoes the `add` of the last block
+        self.blocks.pop()
+        del self.positions[block]
+        self.cell_count -= len(block.shape.offsets)
+        rows = self.rows
+        for dy, _ in block.shape.rows:
+            rows[block.y + dy] -= 1
+
+    def extend(self, blocks: List[Block]):
+        # `add` for many blocks at once, none of them registered yet, e.g. those of a loaded board
+        start = len(self.blocks)
+        self.blocks.extend(blocks)
+        self.positions.update(zip(blocks, range(start, start + len(blocks))))
+        rows = self.rows
+        cell_count = 0
+        for block in blocks:
+            shape, y = block.shape, block.y
+            cell_count += len(shape.offsets)
+            for dy, _ in shape.rows:
+                rows[y + dy] += 1
+        self.cell_count += cell_count
+
+    def discard(self, block: Block):
+        position = self.positions.pop(block, None)
+        if position is None:
+            return
+        last = self.blocks.pop()
+        if last is not block:
+            self.blocks[position] = last
+            self.positions[last] = position
+        self.cell_count -= len(block.shape.offsets)
+        rows = self.rows
+        for dy, _ in block.shape.rows:
+            rows[block.y + dy] -= 1
+        if self.journal is not None:
+            self.journal.append((self.put_back, block, position))
+
+    def put_back(self, block: Block, position: int):
+        # undoes the `discard` of the block that was at `position`, the last block goes back to the end
+        blocks = self.blocks
+        if position < len(blocks):
+            last = blocks[position]
+            self.positions[last] = len(blocks)
+            blocks.append(last)
+            blocks[position] = block
+        else:
+            blocks.append(block)
+        self.positions[block] = position
+        self.cell_count += len(block.shape.offsets)
+        rows = self.rows
+        for dy, _ in block.shape.rows:
+            rows[block.y + dy] += 1
+
+    def sample(self, random: Random) -> Block | None:
+        return self.blocks[random.randrange(len(self.blocks))] if self.blocks else None
+
+    def in_row(self, y: int) -> int:
+        return self.rows[y]
+
+    def snapshot(self) -> tuple:
+        return tuple(self.blocks), dict(self.positions), tuple(self.rows), self.cell_count
+
+    def restore(self, snapshot: tuple):
+        blocks, positions, rows, self.cell_count = snapshot
+        self.blocks = list(blocks)
+        self.positions = dict(positions)
+        self.rows = list(rows)
 
 
 class Board:
     def __init__(self, max_x=16, max_y=16):
         self.max_x = max_x
         self.max_y = max_y
-        self.cells = [[None for _ in range(self.max_x)] for _ in range(self.max_y)]
+        self.cells = [[None] * self.max_x for _ in range(self.max_y)]
+        # every block on the board
+        self.blocks: Set[Block] = set()
+        # bit y of columns[x] is set when a block occupies (x, y), the skyline of the board
+        self.columns: List[int] = [0] * self.max_x
+        # blocks that might be able to fall during the next iteration
+        self.falling: Set[Block] = set()
+        self.resting = RestingBlocks(self.max_y)
+        # Zobrist hash of the position, only kept up to date after `enable_hashing`
+        self.hashing = False
+        self.hash = 0
+        # only recorded after `enable_changes`
+        self.changes: ChangeLog | None = None
+        # inverse operations of the changes since `start_journal`, oldest first
+        self.journal: List[tuple] | None = None
 
     def read_cell(self, x: int, y: int) -> Block | None:
         # standardize x, y order across codebase
@@ -33,8 +168,9 @@ class Board:
             return False
 
     def can_block_be_moved(self, block, dx, dy) -> bool:
-        return all(self.is_cell_free(p.x + dx, p.y + dy) for p in block.location if
-                   Point2D(p.x + dx, p.y + dy) not in block.location)
+        # only the leading edge of the shape can run into other cells
+        x, y = block.x + dx, block.y + dy
+        return all(self.is_cell_free(x + edge_x, y + edge_y) for edge_x, edge_y in block.shape.edge(dx, dy))
 
     def traverse_all_board_cells(self) -> Tuple[int, int, None | Block | Player]:
         for y, row in enumerate(self.cells):
@@ -42,30 +178,83 @@ class Board:
                 yield x, y, cell_value
 
     def traverse_all_board_cells_in_reversed_order(self) -> Tuple[int, int, None | Block | Player]:
-        for y, row in reversed(list(enumerate(self.cells))):
-            for x, cell_value in reversed(list(enumerate(row))):
-                yield x, y, cell_value
+        for y in range(self.max_y - 1, -1, -1):
+            row = self.cells[y]
+            for x in range(self.max_x - 1, -1, -1):
+                yield x, y, row[x]
+
+    def wake_blocks_above(self, cells: Iterable[Offset], obj: Block | Player | None = None):
+        # blocks resting on freed cells have to be checked by the gravity again
+        for x, y in cells:
+            if y > 0:
+                cell_value = self.cells[y - 1][x]
+                if isinstance(cell_value, Block) and cell_value is not obj:
+                    self.falling.add(cell_value)
 
     def move_object(self, obj: Block | Player, dx: int, dy: int):
-        self.remove_object_in_cell(obj.location[0].x, obj.location[0].y)
+        is_block = isinstance(obj, Block)
+        if is_block:
+            self.remove_from_columns(obj)
+        # cells covered before and after the move keep the object: the trailing edge is what it leaves,
+        # the leading edge what it enters
+        left = self.shift_edge(obj, -dx, -dy, None)
+        obj.x += dx
+        obj.y += dy
+        self.shift_edge(obj, dx, dy, obj)
+        if self.hashing:
+            self.hash ^= self.object_key(obj, obj.x - dx, obj.y - dy) ^ self.object_key(obj, obj.x, obj.y)
 
-        new_block_loation: List[Point2D] = []
-        for p in obj.location:
-            self.write_cell(p.x + dx, p.y + dy, obj)
-            new_block_loation.append(Point2D(p.x + dx, p.y + dy))
+        if is_block:
+            self.add_to_columns(obj)
+            # player never supports blocks, so only block moves can free anything
+            self.wake_blocks_above(left, obj)
+        if self.changes is not None:
+            self.changes.moved(obj, dx, dy)
+        if self.journal is not None:
+            self.journal.append((self.move_back, obj, dx, dy))
 
-        obj.location = new_block_loation
+    def move_back(self, obj: Block | Player, dx: int, dy: int):
+        # undoes move_object, nothing is woken or recorded
+        is_block = isinstance(obj, Block)
+        if is_block:
+            self.remove_from_columns(obj)
+        self.shift_edge(obj, dx, dy, None)
+        obj.x -= dx
+        obj.y -= dy
+        self.shift_edge(obj, -dx, -dy, obj)
+        if self.hashing:
+            self.hash ^= self.object_key(obj, obj.x + dx, obj.y + dy) ^ self.object_key(obj, obj.x, obj.y)
+        if is_block:
+            self.add_to_columns(obj)
+
+    def shift_edge(self, obj: Block | Player, dx: int, dy: int, value: Block | Player | None) -> List[Offset]:
+        # writes `value` into the cells of the edge of `obj` leading towards (dx, dy), where it is now
+        cells = [(obj.x + edge_x, obj.y + edge_y) for edge_x, edge_y in obj.shape.edge(dx, dy)]
+        for x, y in cells:
+            self.write_cell(x, y, value)
+        return cells
 
     def move_object_down(self, obj: Block):
         self.move_object(obj, 0, 1)
 
     def add_object(self, obj, current_iteration=0):
-        is_space_free = all(self.is_cell_free(p.x, p.y) for p in obj.location)
+        cells = obj.shape.cells(obj.x, obj.y)
+        is_space_free = all(self.is_cell_free(x, y) for x, y in cells)
 
         if is_space_free:
-            for p in obj.location:
-                self.write_cell(p.x, p.y, obj)
+            for x, y in cells:
+                self.write_cell(x, y, obj)
+            if self.hashing:
+                self.hash ^= self.object_key(obj, obj.x, obj.y)
+            if isinstance(obj, Block):
                 obj.age = current_iteration
+                self.blocks.add(obj)
+                self.falling.add(obj)
+                self.add_to_columns(obj)
+            if self.changes is not None:
+                self.changes.spawned(obj)
+            if self.journal is not None:
+                self.journal.append((self.take_back, obj))
         else:
             raise IndexError(f"Cannot place block that occupies: {obj.location} cells")
 
@@ -75,5 +264,374 @@ class Board:
         if obj is None:
             return None
 
-        for p in obj.location:
-            self.write_cell(p.x, p.y, None)
+        cells = obj.shape.cells(obj.x, obj.y)
+        for cell_x, cell_y in cells:
+            self.write_cell(cell_x, cell_y, None)
+        if self.hashing:
+            self.hash ^= self.object_key(obj, obj.x, obj.y)
+
+        if isinstance(obj, Block):
+            self.blocks.discard(obj)
+            self.falling.discard(obj)
+            self.resting.discard(obj)
+            self.remove_from_columns(obj)
+            self.wake_blocks_above(cells, obj)
+        if self.changes is not None:
+            self.changes.removed(obj)
+        if self.journal is not None:
+            self.journal.append((self.put_back, obj))
+
+    def take_back(self, obj: Block | Player):
+        # undoes add_object
+        for x, y in obj.shape.cells(obj.x, obj.y):
+            self.write_cell(x, y, None)
+        if self.hashing:
+            self.hash ^= self.object_key(obj, obj.x, obj.y)
+        if isinstance(obj, Block):
+            self.blocks.discard(obj)
+            self.remove_from_columns(obj)
+
+    def put_back(self, obj: Block | Player):
+        # undoes remove_object_in_cell
+        for x, y in obj.shape.cells(obj.x, obj.y):
+            self.write_cell(x, y, obj)
+        if self.hashing:
+            self.hash ^= self.object_key(obj, obj.x, obj.y)
+        if isinstance(obj, Block):
+            self.blocks.add(obj)
+            self.add_to_columns(obj)
+
+    def start_journal(self):
+        # From now on every change of the cells, the blocks and the resting blocks is journaled as the call that
+        # takes it back, so `undo_journal` costs what changed rather than the whole board. Falling blocks are not
+        # journaled, they are few enough to be copied.
+        self.journal = self.resting.journal = []
+
+    def stop_journal(self):
+        self.journal = self.resting.journal = None
+
+    def undo_journal(self, length: int):
+        # takes back every change journaled since the journal was `length` long, the latest first
+        journal = self.journal
+        while len(journal) > length:
+            undo, *args = journal.pop()
+            undo(*args)
+
+    def add_to_columns(self, block: Block):
+        columns = self.columns
+        for dx, column_mask in block.shape.columns:
+            columns[block.x + dx] |= column_mask << block.y
+
+    def remove_from_columns(self, block: Block):
+        columns = self.columns
+        for dx, column_mask in block.shape.columns:
+            columns[block.x + dx] &= ~(column_mask << block.y)
+
+    def check_columns(self):
+        # the skyline has to agree with the cells, e.g. after a run of engine.headless.run_session(check=True)
+        columns = [0] * self.max_x
+        for x, y, cell_value in self.traverse_all_board_cells():
+            if isinstance(cell_value, Block):
+                columns[x] |= 1 << y
+        for x, (expected, kept) in enumerate(zip(columns, self.columns)):
+            if expected != kept:
+                raise ValueError(f'Column {x} is {kept:#x} in the skyline but {expected:#x} in the cells.')
+
+    def has_block(self, x: int, y: int) -> bool:
+        return bool(self.columns[x] >> y & 1)
+
+    def column_top(self, x: int) -> int:
+        # row of the highest block of column x, max_y for an empty column
+        column = self.columns[x]
+        return (column & -column).bit_length() - 1 if column else self.max_y
+
+    def fits(self, shape: Shape, x: int, y: int) -> bool:
+        # whether a block of `shape` can be placed with its origin at (x, y), the player does not count
+        if x < 0 or y < 0 or x + shape.width > self.max_x or y + shape.height > self.max_y:
+            return False
+        columns = self.columns
+        return not any(columns[x + dx] & column_mask << y for dx, column_mask in shape.columns)
+
+    def drop_distance(self, shape: Shape, x: int, y: int) -> int:
+        # how far a block of `shape` placed at (x, y) falls before it comes to rest,
+        # the cells of a shape within one column are contiguous, so only its lowest cell there matters
+        distance = self.max_y
+        columns = self.columns
+        for dx, column_mask in shape.columns:
+            bottom = y + column_mask.bit_length() - 1
+            below = columns[x + dx] >> bottom + 1
+            distance = min(distance, (below & -below).bit_length() - 1 if below else self.max_y - 1 - bottom)
+        return distance
+
+    def spawn_columns(self, shape: Shape) -> List[int]:
+        # every x where a block of `shape` fits into the top row
+        return [x for x in range(self.max_x - shape.width + 1) if self.fits(shape, x, 0)]
+
+    def snapshot_cells(self):
+        return tuple(map(tuple, self.cells))
+
+    def restore_cells(self, cells):
+        self.cells = [list(row) for row in cells]
+
+    def snapshot(self) -> tuple:
+        # blocks keep their identity, only their mutable state is saved next to the cells
+        return (self.snapshot_cells(),
+                tuple((block, block.x, block.y, block.age, block.age_not_in_motion) for block in self.blocks),
+                tuple(self.falling),
+                self.resting.snapshot(),
+                self.hash,
+                tuple(self.columns))
+
+    def restore(self, snapshot: tuple):
+        cells, blocks, falling, resting, self.hash, columns = snapshot
+        self.columns = list(columns)
+        self.restore_cells(cells)
+        self.blocks = set()
+        for block, x, y, age, age_not_in_motion in blocks:
+            block.x, block.y, block.age, block.age_not_in_motion = x, y, age, age_not_in_motion
+            self.blocks.add(block)
+        self.falling = set(falling)
+        self.resting.restore(resting)
+        if self.changes is not None:
+            self.changes.reset()
+
+    def empty_copy(self) -> 'Board':
+        return type(self)(self.max_x, self.max_y)
+
+    def fill(self, cells: List[Block | Player | None], blocks: Iterable[Block], falling: Iterable[Block],
+             columns: List[int] | None = None):
+        # gives an empty board its cells (row by row) and the blocks in them, in one go, e.g. to load a saved game;
+        # resting blocks are registered in the order of `blocks`, `columns` saves working out the skyline when
+        # the caller knows it already
+        blocks = list(blocks)
+        self.blocks = set(blocks)
+        self.falling = set(falling)
+        self.resting.extend([block for block in blocks if block.age_not_in_motion])
+        if columns is not None:
+            self.columns = columns
+        else:
+            for block in self.blocks:
+                self.add_to_columns(block)
+        self.fill_cells(cells)
+
+    def flat_cells(self) -> List[Block | Player | None]:
+        # every cell, row by row, what `fill` takes
+        return list(chain.from_iterable(self.cells))
+
+    def fill_cells(self, cells: List[Block | Player | None]):
+        max_x = self.max_x
+        self.cells = [cells[start:start + max_x] for start in range(0, max_x * self.max_y, max_x)]
+
+    def enable_changes(self) -> ChangeLog:
+        if self.changes is None:
+            self.changes = ChangeLog()
+        return self.changes
+
+    def add_write_hook(self, hook: Callable[[int, int, Block | Player | None], None]):
+        # `hook(x, y, obj)` runs right before every following write_cell, while the cell still has its old content
+        write_cell = self.write_cell
+
+        def hooked_write_cell(x: int, y: int, obj: Block | None) -> None:
+            hook(x, y, obj)
+            write_cell(x, y, obj)
+
+        self.write_cell = hooked_write_cell
+
+    def enable_hashing(self, seed=0):
+        # From now on `self.hash` is the xor of the keys of the objects on the board: placing, moving or removing
+        # one xors its key at the old and the new origin. The key of an object at an origin is the xor of the keys
+        # of its cells, and a cell key depends on the cell, the kind of the object and which cell of its shape it
+        # is, so equal positions hash the same no matter which block objects make them up. A crushed player
+        # keeps its key, the block on it is only counted for its own cells.
+        if self.hashing:
+            return
+        cell_keys: Dict[Tuple[int, int, int, int], int] = {}
+        object_keys: Dict[Tuple[type, int, int], int] = {}
+
+        def cell_key(key: Tuple[int, int, int, int]) -> int:
+            value = cell_keys.get(key)
+            if value is None:
+                # splitmix64 of the key, so the table does not depend on the order keys are first needed
+                value = (seed + hash(key) * 0x9e3779b97f4a7c15) & 0xffffffffffffffff
+                value = (value ^ value >> 30) * 0xbf58476d1ce4e5b9 & 0xffffffffffffffff
+                value = (value ^ value >> 27) * 0x94d049bb133111eb & 0xffffffffffffffff
+                value = cell_keys[key] = value ^ value >> 31
+            return value
+
+        def object_key(obj: Block | Player, x: int, y: int) -> int:
+            key = (type(obj), x, y)
+            value = object_keys.get(key)
+            if value is None:
+                kind = cell_kind(obj)
+                value = 0
+                for index, (dx, dy) in enumerate(obj.shape.offsets):
+                    value ^= cell_key((x + dx, y + dy, kind, index))
+                object_keys[key] = value
+            return value
+
+        self.object_key = object_key
+        self.hash = 0
+        for x, y, cell_value in self.traverse_all_board_cells():
+            if cell_value is not None:
+                self.hash ^= cell_key((x, y, cell_kind(cell_value),
+                                       cell_value.shape.offsets.index((x - cell_value.x, y - cell_value.y))))
+        self.hashing = True
+
+    def clone(self, player: Player | None = None) -> 'Board':
+        # independent board with copies of all blocks, `player` takes the place of the current player
+        board = self.empty_copy()
+        copies = {block: block.copy() for block in self.blocks}
+        for block in copies.values():
+            for x, y in block.shape.cells(block.x, block.y):
+                board.write_cell(x, y, block)
+        if player is not None and isinstance(self.read_cell(player.x, player.y), Player):
+            board.write_cell(player.x, player.y, player)
+        board.blocks = set(copies.values())
+        board.columns = list(self.columns)
+        board.falling = {copies[block] for block in self.falling}
+        for block in self.resting:
+            board.resting.add(copies[block])
+        return board
+
+
+class BitBoard(Board):
+    # Collision checks are shift-and-AND operations on `columns`, the skyline bitmasks every board keeps of
+    # its blocks, instead of per-cell read_cell/isinstance calls. `cells` still maps cells to objects.
+    def is_cell_free(self, x: int, y: int) -> bool:
+        return 0 <= x < self.max_x and 0 <= y < self.max_y and not self.columns[x] >> y & 1
+
+    def can_block_be_moved(self, block, dx, dy) -> bool:
+        shape = block.shape
+        x, y = block.x + dx, block.y + dy
+        if x < 0 or y < 0 or x + shape.width > self.max_x or y + shape.height > self.max_y:
+            return False
+        # only the leading edge of the shape can run into other blocks
+        columns = self.columns
+        for edge_x, edge_mask in shape.column_edge(dx, dy):
+            if columns[x + edge_x] & edge_mask << y:
+                return False
+        return True
+
+
+class ChunkedBoard(Board):
+    # Sparse board for very large playfields: cells live in square chunks that are allocated when something
+    # is written into them and dropped once they are empty again, so memory follows the occupied area.
+    # Gravity only ever visits `falling` blocks, chunks without any of them are asleep.
+    def __init__(self, max_x=16, max_y=16, chunk_bits=5):
+        self.max_x = max_x
+        self.max_y = max_y
+        self.chunk_bits = chunk_bits
+        self.chunk_size = 1 << chunk_bits
+        self.chunk_mask = self.chunk_size - 1
+        self.chunks: Dict[Tuple[int, int], List[Block | Player | None]] = {}
+        # number of occupied cells of every allocated chunk
+        self.chunk_counts: Dict[Tuple[int, int], int] = {}
+        self.blocks: Set[Block] = set()
+        self.columns: List[int] = [0] * self.max_x
+        self.falling: Set[Block] = set()
+        self.resting = RestingBlocks(self.max_y)
+        self.hashing = False
+        self.hash = 0
+        self.changes: ChangeLog | None = None
+        self.journal: List[tuple] | None = None
+
+    def read_cell(self, x: int, y: int) -> Block | None:
+        if 0 <= x < self.max_x and 0 <= y < self.max_y:
+            chunk = self.chunks.get((x >> self.chunk_bits, y >> self.chunk_bits))
+            if chunk is None:
+                return None
+            return chunk[(y & self.chunk_mask) << self.chunk_bits | x & self.chunk_mask]
+        else:
+            raise IndexError(f'There is no ({x}, {y}) cell in the board.')
+
+    def write_cell(self, x: int, y: int, obj: Block | None) -> None:
+        key = (x >> self.chunk_bits, y >> self.chunk_bits)
+        index = (y & self.chunk_mask) << self.chunk_bits | x & self.chunk_mask
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            if obj is None:
+                return
+            chunk = self.chunks[key] = [None] * (self.chunk_size * self.chunk_size)
+            self.chunk_counts[key] = 0
+
+        old = chunk[index]
+        chunk[index] = obj
+        if old is None and obj is not None:
+            self.chunk_counts[key] += 1
+        elif old is not None and obj is None:
+            self.chunk_counts[key] -= 1
+            if not self.chunk_counts[key]:
+                del self.chunks[key]
+                del self.chunk_counts[key]
+
+    def is_cell_free(self, x: int, y: int) -> bool:
+        if 0 <= x < self.max_x and 0 <= y < self.max_y:
+            chunk = self.chunks.get((x >> self.chunk_bits, y >> self.chunk_bits))
+            return chunk is None or not isinstance(
+                chunk[(y & self.chunk_mask) << self.chunk_bits | x & self.chunk_mask], Block)
+        return False
+
+    def snapshot_cells(self):
+        return {key: tuple(chunk) for key, chunk in self.chunks.items()}, dict(self.chunk_counts)
+
+    def restore_cells(self, cells):
+        chunks, chunk_counts = cells
+        self.chunks = {key: list(chunk) for key, chunk in chunks.items()}
+        self.chunk_counts = dict(chunk_counts)
+
+    def empty_copy(self) -> 'ChunkedBoard':
+        return type(self)(self.max_x, self.max_y, self.chunk_bits)
+
+    def flat_cells(self) -> List[Block | Player | None]:
+        # every cell, row by row, what `fill` takes
+        return [cell_value for _, _, cell_value in self.traverse_all_board_cells()]
+
+    def fill_cells(self, cells: List[Block | Player | None]):
+        max_x = self.max_x
+        for index, cell_value in enumerate(cells):
+            if cell_value is not None:
+                self.write_cell(index % max_x, index // max_x, cell_value)
+
+    def wake_blocks_above(self, cells: Iterable[Offset], obj: Block | Player | None = None):
+        for x, y in cells:
+            if y > 0:
+                cell_value = self.read_cell(x, y - 1)
+                if isinstance(cell_value, Block) and cell_value is not obj:
+                    self.falling.add(cell_value)
+
+    def row_segments(self, y: int, reverse=False):
+        # (first x, cells or None for an unallocated chunk) for every chunk crossed by row y
+        offset = (y & self.chunk_mask) << self.chunk_bits
+        chunk_xs = range((self.max_x - 1 >> self.chunk_bits) + 1)
+        for chunk_x in reversed(chunk_xs) if reverse else chunk_xs:
+            first_x = chunk_x << self.chunk_bits
+            width = min(self.chunk_size, self.max_x - first_x)
+            chunk = self.chunks.get((chunk_x, y >> self.chunk_bits))
+            yield first_x, width, chunk[offset:offset + width] if chunk is not None else None
+
+    def traverse_all_board_cells(self) -> Tuple[int, int, None | Block | Player]:
+        for y in range(self.max_y):
+            for first_x, width, row in self.row_segments(y):
+                if row is None:
+                    yield from ((x, y, None) for x in range(first_x, first_x + width))
+                else:
+                    yield from ((first_x + x, y, cell_value) for x, cell_value in enumerate(row))
+
+    def traverse_all_board_cells_in_reversed_order(self) -> Tuple[int, int, None | Block | Player]:
+        for y in range(self.max_y - 1, -1, -1):
+            for first_x, width, row in self.row_segments(y, reverse=True):
+                for x in range(width - 1, -1, -1):
+                    yield first_x + x, y, row[x] if row is not None else None
+
+    def traverse_occupied_cells(self) -> Tuple[int, int, Block | Player]:
+        # only visits allocated chunks, in no particular order
+        for (chunk_x, chunk_y), chunk in self.chunks.items():
+            for index, cell_value in enumerate(chunk):
+                if cell_value is not None:
+                    yield ((chunk_x << self.chunk_bits) + (index & self.chunk_mask),
+                           (chunk_y << self.chunk_bits) + (index >> self.chunk_bits),
+                           cell_value)
+
+    def awake_chunks(self) -> Set[Tuple[int, int]]:
+        return {((block.x + dx) >> self.chunk_bits, (block.y + dy) >> self.chunk_bits)
+                for block in self.falling for dx, dy in block.shape.offsets}
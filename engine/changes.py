@@ -0,0 +1,66 @@
+from typing import Callable, List, Set, Tuple
+
+from engine.blocks import Block, Offset
+from engine.player import Player
+
+MOVED = 1
+SPAWNED = 2
+REMOVED = 3
+RESET = 4  # the whole board was replaced, e.g. by Board.restore
+
+# (event, object, x, y, dx, dy): x and y are the origin of the object right after the change,
+# dx and dy the move that got it there
+Event = Tuple[int, Block | Player | None, int, int, int, int]
+
+
+def event_cells(event: Event) -> List[Offset]:
+    # every cell the event wrote, for a move both the cells left and the cells entered
+    code, obj, x, y, dx, dy = event
+    cells = obj.shape.cells(x, y)
+    if code == MOVED:
+        cells += obj.shape.cells(x - dx, y - dy)
+    return cells
+
+
+def changed_cells(events: List[Event]) -> Set[Offset] | None:
+    # None when the events cannot be applied cell by cell and the whole board has to be read again
+    cells = set()
+    for event in events:
+        if event[0] == RESET:
+            return None
+        cells.update(event_cells(event))
+    return cells
+
+
+class ChangeLog:
+    # Changes of a board, collected into a list until `flush` hands the batch to every subscriber.
+    # Schedule flushes once per frame, a consumer may also flush to see changes made since then.
+    def __init__(self):
+        self.events: List[Event] = []
+        self.subscribers: List[Callable[[int | None, List[Event]], None]] = []
+
+    def subscribe(self, subscriber: Callable[[int | None, List[Event]], None]):
+        self.subscribers.append(subscriber)
+
+    def unsubscribe(self, subscriber: Callable[[int | None, List[Event]], None]):
+        self.subscribers.remove(subscriber)
+
+    def moved(self, obj: Block | Player, dx: int, dy: int):
+        self.events.append((MOVED, obj, obj.x, obj.y, dx, dy))
+
+    def spawned(self, obj: Block | Player):
+        self.events.append((SPAWNED, obj, obj.x, obj.y, 0, 0))
+
+    def removed(self, obj: Block | Player):
+        self.events.append((REMOVED, obj, obj.x, obj.y, 0, 0))
+
+    def reset(self):
+        self.events.append((RESET, None, 0, 0, 0, 0))
+
+    def flush(self, tick: int | None = None) -> List[Event]:
+        events = self.events
+        if events:
+            self.events = []
+            for subscriber in self.subscribers:
+                subscriber(tick, events)
+        return events
@@ -1,92 +1,433 @@
-from random import choice, randint
+import struct
+from array import array
+from heapq import heapify, heappop, heappush
+from random import Random, randrange
+from typing import Any, Callable, List, NamedTuple, Set, Tuple
 
 from engine import blocks
 from engine.blocks import Block
 from engine.player import Player
-from engine.board import Board
+from engine.board import BLOCK_KINDS, BLOCK_TYPES, EMPTY_CELL, PLAYER_CELL, Board
 from engine.point import Point2D
 
 
+POSSIBLE_BLOCKS = [
+    # blocks.HorizontalLine4Block,
+    blocks.TBlock1,
+    blocks.VerticalLine4Block,
+    blocks.SHorizontalBlock,
+    blocks.SVerticalBlock,
+    blocks.ZHorizontalBlock,
+    blocks.ZVerticalBlock,
+]
+
+# seeds are stored as uint64 (recordings, saved games, board pools), any other int is taken modulo SEED_RANGE
+SEED_RANGE = 1 << 64
+
+# A saved game is a header, the cell kinds (engine.board.cell_kind) and block ids (0 for no block, uint16 or uint32)
+# of every cell row by row, the table of blocks, whose ids are their positions in it starting with 1, and the
+# state of the game's random generator. Little-endian, like the rest of the files, a big-endian host cannot load it.
+SAVE_MAGIC = b'KRSV'
+SAVE_VERSION = 1
+# magic, version, bytes per block id, max_x, max_y, upper lines, seed, iteration, blocks eaten, player x, player y,
+# number of blocks
+SAVE_HEADER = struct.Struct('<4sBBHHHQIIHHI')
+SAVE_BLOCK = struct.Struct('<BHHIIB')  # kind, x, y, age, age not in motion, falling
+RANDOM_STATE_SIZE = 625  # words of a Mersenne Twister state, the last one is its position
+BLOCK_CHARS = {kind: block_type(0, 0).char for kind, block_type in BLOCK_TYPES.items()}
+BLOCK_DIGITS = bytes.maketrans(bytes(range(256)), b'00' + b'1' * 254)
+
+
 class GameEnd(Exception):
     pass
 
 
+class GameSnapshot(NamedTuple):
+    board: tuple
+    player: Tuple[int, int]
+    current_iteration: int
+    blocks_eaten: int
+    random_state: tuple
+
+
+class UndoMark(NamedTuple):
+    # where `Game.apply` started: the length of the board's journal and what is not journaled
+    journal_length: int
+    falling: Set[Block]
+    current_iteration: int
+    blocks_eaten: int
+    player_on_board: bool
+
+
+def set_ages(block: Block, age: int, age_not_in_motion: int):
+    # journaled by the gravity to take its ages back
+    block.age, block.age_not_in_motion = age, age_not_in_motion
+
+
+def pack_board(board: Board, player: Player | None = None) -> Tuple[int, int, bytes]:
+    # The cells and blocks of a saved game: bytes per block id, number of blocks and the data. Resting blocks go
+    # first and in their order, so that the loaded game draws the same ones to destroy.
+    resting = board.resting
+    blocks = list(resting)
+    blocks.extend(block for block in board.blocks if block not in resting)
+    falling = board.falling
+    block_kinds = [BLOCK_KINDS[type(block)] for block in blocks]
+    cell_ids = dict(zip(blocks, range(1, len(blocks) + 1)))
+    cell_ids[None] = 0
+    if player is not None:
+        cell_ids[player] = 0
+
+    ids = list(map(cell_ids.__getitem__, board.flat_cells()))
+    kinds = bytearray(map([EMPTY_CELL, *block_kinds].__getitem__, ids))
+    if player is not None and board.read_cell(player.x, player.y) is player:
+        kinds[player.y * board.max_x + player.x] = PLAYER_CELL
+    id_code = 'H' if len(blocks) < 1 << 16 else 'I'
+    table = b''.join([SAVE_BLOCK.pack(kind, block.x, block.y, block.age, block.age_not_in_motion, block in falling)
+                      for block, kind in zip(blocks, block_kinds)])
+    return struct.calcsize(id_code), len(blocks), b''.join((kinds, struct.pack(f'<{len(ids)}{id_code}', *ids), table))
+
+
+def unpack_board(data: bytes, position: int, board: Board, id_size: int, block_count: int,
+                 player: Player | None = None) -> int:
+    # fills the empty `board` from what pack_board made, starting at `position`; returns the position after it
+    max_x = board.max_x
+    cells = max_x * board.max_y
+    kinds = data[position:position + cells]
+    position += cells
+    ids = struct.unpack_from(f'<{cells}{"H" if id_size == 2 else "I"}', data, position)
+    position += cells * id_size
+
+    # blocks are made like Block.copy does, __init__ would only set what is overwritten right away
+    objects: List[Block | Player | None] = [None]
+    falling = []
+    new, add_object, add_falling = object.__new__, objects.append, falling.append
+    table = data[position:position + block_count * SAVE_BLOCK.size]
+    for kind, x, y, age, age_not_in_motion, is_falling in SAVE_BLOCK.iter_unpack(table):
+        block = new(BLOCK_TYPES[kind])
+        block.x = x
+        block.y = y
+        block.char = BLOCK_CHARS[kind]
+        block.age = age
+        block.age_not_in_motion = age_not_in_motion
+        add_object(block)
+        if is_falling:
+            add_falling(block)
+    position += len(table)
+
+    board_cells = list(map(objects.__getitem__, ids))
+    if player is not None and kinds[player.y * max_x + player.x] == PLAYER_CELL:
+        board_cells[player.y * max_x + player.x] = player
+    # the skyline straight from the kinds: one column at a time, its block cells as binary digits
+    columns = [int(kinds[x::max_x][::-1].translate(BLOCK_DIGITS), 2) for x in range(max_x)]
+    board.fill(board_cells, objects[1:], falling, columns)
+    return position
+
+
 class Game:
-    def __init__(self, max_x=16, max_y=16):
+    def __init__(self, max_x=16, max_y=16, board_type=Board, seed: int | None = None, pool=None):
+        # `pool` is an engine.pool.BoardPool, a starting board found there is loaded instead of generated
+        # every random decision of a game comes from its own generator, so a seed reproduces the whole game
+        self.seed = (seed if seed is not None else randrange(1 << 63)) % SEED_RANGE
+        self.random = Random(self.seed)
         self.upper_lines = 4
         self.max_x = max_x
         self.max_y = max_y + self.upper_lines
         self.current_iteration = 0
-        self.possible_blocks = [
-            # blocks.HorizontalLine4Block,
-            blocks.TBlock1,
-            blocks.VerticalLine4Block,
-            blocks.SHorizontalBlock,
-            blocks.SVerticalBlock,
-            blocks.ZHorizontalBlock,
-            blocks.ZVerticalBlock,
-        ]
-
-        self.board = Board(self.max_x, self.max_y)
-        self.populate_starting_board()
+        self.possible_blocks = list(POSSIBLE_BLOCKS)
+        # blocks the gravity looked at during the last iteration
+        self.checked_blocks = set()
+
+        self.board = board_type(self.max_x, self.max_y)
+        if pool is None or not pool.load(self):
+            self.populate_starting_board()
 
         self.player = Player(self, self.max_x // 2, self.max_y - 1)
         self.board.add_object(self.player)
 
         self.blocks_eaten = 0
+        # where every `apply` started, most recent last
+        self.undo_stack: List[UndoMark] = []
 
     obituary = 'Ś.P. Kret zdechł'
 
+    @staticmethod
+    def gravity_order(block: Block) -> Tuple[int, int]:
+        # blocks are settled bottom-up, right to left, by their lowest right-most cell
+        dx, dy = block.shape.bottom_right
+        return -block.y - dy, -block.x - dx
+
     def next_iteration(self):
         self.current_iteration += 1
+        board = self.board
 
-        for x, y, cell_value in self.board.traverse_all_board_cells_in_reversed_order():
-            if isinstance(cell_value, Block):
-                block: Block = cell_value
-
-                if block.age == self.current_iteration:
-                    continue
-
-                if self.board.can_block_be_moved(block, 0, 1):
-                    self.board.move_object_down(block)
-                    block.age_not_in_motion = 0
-                else:
-                    block.age_not_in_motion += 1
-                block.age = self.current_iteration
-
-    def generate_new_block(self, tries=5, location: None | Point2D = None):
-        new_block = choice(self.possible_blocks)
-        block_location = location or Point2D(randint(0, self.max_x), 0)
-        for _ in range(tries):
-            try:
-                self.board.add_object(new_block(block_location.x, block_location.y), self.current_iteration)
+        queue = [self.gravity_order(block) + (block,) for block in board.falling]
+        heapify(queue)
+        queued = set(board.falling)
+        board.falling = woken = set()
+        still_falling = set()
+        checked = set()
+        journal = board.journal
+
+        while queue:
+            order_y, order_x, block = heappop(queue)
+            checked.add(block)
+            if journal is not None:
+                journal.append((set_ages, block, block.age, block.age_not_in_motion))
+
+            if board.can_block_be_moved(block, 0, 1):
+                if block.age_not_in_motion:
+                    board.resting.discard(block)
+                board.move_object_down(block)
+                block.age_not_in_motion = 0
+                still_falling.add(block)
+            else:
+                if not block.age_not_in_motion:
+                    board.resting.add(block)
+                block.age_not_in_motion += 1
+            block.age = self.current_iteration
+
+            for other in woken:
+                if other not in queued:
+                    order = self.gravity_order(other)
+                    if order > (order_y, order_x):
+                        # not reached yet in this iteration
+                        queued.add(other)
+                        heappush(queue, order + (other,))
+                        continue
+                    still_falling.add(other)
+                elif other in checked:
+                    still_falling.add(other)
+            woken.clear()
+
+        board.falling = still_falling
+        self.checked_blocks = checked
+
+    def advance(self, ticks: int):
+        # The same as `ticks` calls of next_iteration with nothing else happening in between, at the cost of
+        # the landings rather than of the ticks: while every falling block is sure to keep falling, they all
+        # drop the whole way in one go, and once nothing falls the ticks that are left change only the count.
+        board = self.board
+        end = self.current_iteration + ticks
+        while self.current_iteration < end:
+            if not board.falling:
+                self.current_iteration = end
+                self.checked_blocks = set()
                 break
-            except IndexError:
-                pass
+            free_fall = min(self.free_fall_ticks(), end - self.current_iteration)
+            if free_fall > 1:
+                self.fall_together(free_fall)
+            else:
+                self.next_iteration()
+
+    def free_fall_ticks(self) -> int:
+        # For how many iterations every falling block moves down, 0 when some would not move in the next one.
+        # A block keeps moving when under each of its columns there is free space, or a falling block that
+        # gravity moves before it, and no block that is not falling rests on it, as that one would be woken.
+        board = self.board
+        falling = board.falling
+        player = self.player
+        player_on_board = board.read_cell(player.x, player.y) is player
+        columns = board.columns
+        ticks = board.max_y
+        for block in falling:
+            if block.age_not_in_motion:
+                # it would leave the resting blocks on the way, in an order only next_iteration knows
+                return 0
+            order = self.gravity_order(block)
+            for dx, column_mask in block.shape.columns:
+                x = block.x + dx
+                top = block.y + (column_mask & -column_mask).bit_length() - 1
+                bottom = block.y + column_mask.bit_length() - 1
+                if top > 0:
+                    above = board.read_cell(x, top - 1)
+                    if isinstance(above, Block) and above not in falling:
+                        return 0
+                if bottom + 1 < board.max_y:
+                    below = board.read_cell(x, bottom + 1)
+                    if isinstance(below, Block) and below in falling and self.gravity_order(below) < order:
+                        continue
+                below = columns[x] >> bottom + 1
+                distance = (below & -below).bit_length() - 1 if below else board.max_y - 1 - bottom
+                if player_on_board and player.x == x and bottom < player.y <= bottom + distance:
+                    # falling into the player crushes it, next_iteration takes care of that
+                    distance = player.y - bottom - 1
+                if distance < ticks:
+                    if distance == 0:
+                        return 0
+                    ticks = distance
+        return ticks
+
+    def fall_together(self, ticks: int):
+        # `ticks` iterations in which every falling block moves down, see free_fall_ticks
+        board = self.board
+        self.current_iteration += ticks
+        journal = board.journal
+        # bottom-up, every block moves into space that is already free
+        for block in sorted(board.falling, key=self.gravity_order):
+            board.move_object(block, 0, ticks)
+            if journal is not None:
+                journal.append((set_ages, block, block.age, block.age_not_in_motion))
+            block.age = self.current_iteration
+        self.checked_blocks = set(board.falling)
+
+    def generate_new_block(self, location: None | Point2D = None):
+        # a new block only goes where it fits, into the top row unless `location` says otherwise
+        self.journal_random()
+        new_block = self.random.choice(self.possible_blocks)
+        shape = new_block.shape
+        board = self.board
+        if location is not None:
+            x, y = location.x, location.y
+            if not board.fits(shape, x, y):
+                return
+        else:
+            x, y = self.random.randrange(self.max_x - shape.width + 1), 0
+            if not board.fits(shape, x, y):
+                # the drawn spot is taken, any other one where the block fits is as good
+                columns = board.spawn_columns(shape)
+                if not columns:
+                    return
+                x = self.random.choice(columns)
+        board.add_object(new_block(x, y), self.current_iteration)
 
     def destroy_static_block(self):
-        x, y = randint(0, self.max_x - 1), randint(0, self.max_y - 1)
-        cell_value = self.board.read_cell(x, y)
-        if not isinstance(cell_value, Block):
+        # A block goes as often as probing a random cell of the board would hit a resting one, so the fuller
+        # the board the more often, but which one goes is drawn uniformly from the resting blocks.
+        resting = self.board.resting
+        self.journal_random()
+        if self.random.randrange(self.max_x * self.max_y) >= resting.cell_count:
             return
-        block: Block = cell_value
+        block = resting.sample(self.random)
+        if block is not None:
+            dx, dy = block.shape.offsets[0]
+            self.board.remove_object_in_cell(block.x + dx, block.y + dy)
 
-        if block.age_not_in_motion != 0:
-            self.board.remove_object_in_cell(x, y)
+    def journal_random(self):
+        # the generator is about to draw, copying its state costs more than most steps, so only then
+        journal = self.board.journal
+        if journal is not None:
+            journal.append((self.random.setstate, self.random.getstate()))
 
     def populate_starting_board(self):
-        for _ in range(self.board.max_x * self.board.max_y // 3):
-            self.generate_new_block(tries=1,
-                                    location=Point2D(
-                                        x=randint(0, self.max_x),
-                                        y=randint(0, self.max_y))
-                                    )
-            self.next_iteration()
-            self.board.remove_object_in_cell(self.max_x // 2, self.max_y - 1)
-        self.current_iteration = 0
+        # A settled pile: blocks show up at random spots and every one drops straight to where it comes to rest,
+        # with no iterations in between. The spot of the player stays free.
+        board = self.board
+        player_x, player_y = self.max_x // 2, self.max_y - 1
+        for _ in range(board.max_x * board.max_y // 3):
+            block_type = self.random.choice(self.possible_blocks)
+            shape = block_type.shape
+            x = self.random.randint(0, self.max_x - shape.width)
+            y = self.random.randint(0, self.max_y - shape.height)
+            if not board.fits(shape, x, y):
+                continue
+            y += board.drop_distance(shape, x, y)
+            if (player_x - x, player_y - y) not in shape.offsets:
+                self.add_resting_block(block_type, x, y)
+
+    def add_resting_block(self, block_type, x: int, y: int):
+        # a block of the starting board, it does not wait for an iteration to find out it is not falling
+        block = block_type(x, y)
+        self.board.add_object(block, self.current_iteration)
+        self.board.falling.discard(block)
+        block.age_not_in_motion = 1
+        self.board.resting.add(block)
 
     def traverse_visible_board_cells(self):
         yield from ((x, y - self.upper_lines, cell_value)
                     for x, y, cell_value
                     in self.board.traverse_all_board_cells()
                     if y >= self.upper_lines)
+
+    def snapshot(self) -> GameSnapshot:
+        # cheap copy of everything that changes while playing, to be given back to `restore`
+        return GameSnapshot(self.board.snapshot(), (self.player.x, self.player.y), self.current_iteration,
+                            self.blocks_eaten, self.random.getstate())
+
+    def restore(self, snapshot: GameSnapshot):
+        self.board.restore(snapshot.board)
+        self.player.x, self.player.y = snapshot.player
+        self.current_iteration = snapshot.current_iteration
+        self.blocks_eaten = snapshot.blocks_eaten
+        self.random.setstate(snapshot.random_state)
+
+    def clone(self) -> 'Game':
+        # independent game in the same state, without the undo history; the state is copied field by field,
+        # methods patched onto this game (e.g. by engine.profiling) stay bound to it and are not copied
+        game = object.__new__(type(self))
+        game.seed = self.seed
+        game.random = Random()
+        game.random.setstate(self.random.getstate())
+        game.upper_lines = self.upper_lines
+        game.max_x = self.max_x
+        game.max_y = self.max_y
+        game.current_iteration = self.current_iteration
+        game.possible_blocks = list(self.possible_blocks)
+        game.checked_blocks = set()
+        game.blocks_eaten = self.blocks_eaten
+        game.undo_stack = []
+        game.player = Player(game, self.player.x, self.player.y)
+        game.board = self.board.clone(game.player)
+        return game
+
+    def save(self) -> bytes:
+        # everything `load` needs to go on exactly where this game is, without the undo history
+        id_size, block_count, board = pack_board(self.board, self.player)
+        header = SAVE_HEADER.pack(SAVE_MAGIC, SAVE_VERSION, id_size, self.max_x, self.max_y, self.upper_lines,
+                                  self.seed, self.current_iteration, self.blocks_eaten, self.player.x, self.player.y,
+                                  block_count)
+        return b''.join((header, board, array('I', self.random.getstate()[1]).tobytes()))
+
+    @classmethod
+    def load(cls, data: bytes, board_type=Board) -> 'Game':
+        (magic, version, id_size, max_x, max_y, upper_lines, seed, current_iteration, blocks_eaten,
+         player_x, player_y, block_count) = SAVE_HEADER.unpack_from(data)
+        if magic != SAVE_MAGIC or version != SAVE_VERSION:
+            raise ValueError('Not a pykret saved game.')
+
+        game = object.__new__(cls)
+        game.seed = seed
+        game.upper_lines = upper_lines
+        game.max_x = max_x
+        game.max_y = max_y
+        game.current_iteration = current_iteration
+        game.possible_blocks = list(POSSIBLE_BLOCKS)
+        game.checked_blocks = set()
+        game.blocks_eaten = blocks_eaten
+        game.undo_stack = []
+        game.player = Player(game, player_x, player_y)
+        game.board = board_type(max_x, max_y)
+        position = unpack_board(data, SAVE_HEADER.size, game.board, id_size, block_count, game.player)
+
+        state = array('I')
+        state.frombytes(data[position:position + RANDOM_STATE_SIZE * 4])
+        # setstate replaces the whole state, so the generator is not seeded first
+        game.random = Random.__new__(Random)
+        game.random.setstate((3, tuple(state), None))
+        return game
+
+    def apply(self, action: Callable[..., Any], *args) -> Any:
+        # runs a move or a tick, e.g. `game.apply(game.player.move_x, 1)`, so that `undo` can take it back;
+        # the board journals what the action changes (Board.start_journal) while anything is left to undo
+        board = self.board
+        if board.journal is None:
+            board.start_journal()
+        player = self.player
+        self.undo_stack.append(UndoMark(len(board.journal), set(board.falling), self.current_iteration,
+                                        self.blocks_eaten, board.read_cell(player.x, player.y) is player))
+        return action(*args)
+
+    def undo(self):
+        mark = self.undo_stack.pop()
+        board = self.board
+        board.undo_journal(mark.journal_length)
+        board.falling = mark.falling
+        player = self.player
+        if mark.player_on_board and board.read_cell(player.x, player.y) is None:
+            # a block that crushed the player has moved back out of its cell
+            board.write_cell(player.x, player.y, player)
+        self.current_iteration = mark.current_iteration
+        self.blocks_eaten = mark.blocks_eaten
+        if not self.undo_stack:
+            board.stop_journal()
+        if board.changes is not None:
+            board.changes.reset()
@@ -0,0 +1,142 @@
+import random
+from importlib import import_module
+from time import perf_counter
+from typing import Callable
+
+from engine.autopilot import Autopilot
+from engine.blocks import Block
+from engine.game import Game, GameEnd
+from engine.history import HistoryRecorder
+from engine.profiling import Profiler
+from engine.replay import Recorder
+from engine.schedule import KEY_LEFT, KEY_RIGHT, KEY_UP, Schedule
+
+# a policy is called once per frame and returns the key pressed during that frame (or None)
+Policy = Callable[[Game, Schedule], str | None]
+
+
+def parse_size(size: str):
+    # the board size options of the scripts, e.g. '64x32'
+    max_x, _, max_y = size.partition('x')
+    return int(max_x), int(max_y)
+
+
+class IdlePolicy:
+    def __init__(self, seed=None):
+        pass
+
+    def __call__(self, game: Game, schedule: Schedule) -> str | None:
+        return None
+
+
+class RandomPolicy:
+    def __init__(self, seed=None, keys_per_second=5):
+        self.random = random.Random(seed)
+        self.keys_per_second = keys_per_second
+
+    def __call__(self, game: Game, schedule: Schedule) -> str | None:
+        if self.random.random() < self.keys_per_second / schedule.fps:
+            return self.random.choice((KEY_LEFT, KEY_RIGHT, KEY_UP))
+        return None
+
+
+class EatAbovePolicy:
+    # keeps eating whatever is right above the player, otherwise wanders towards the emptier side
+    def __init__(self, seed=None, keys_per_second=5):
+        self.random = random.Random(seed)
+        self.keys_per_second = keys_per_second
+
+    def __call__(self, game: Game, schedule: Schedule) -> str | None:
+        if self.random.random() >= self.keys_per_second / schedule.fps:
+            return None
+        player = game.player
+        if player.y > 0 and isinstance(game.board.read_cell(player.x, player.y - 1), Block):
+            return KEY_UP
+        return KEY_LEFT if player.x >= game.max_x // 2 else KEY_RIGHT
+
+
+class AutopilotPolicy:
+    # the autopilot plans one key per iteration, so it only searches on the first frame of every iteration
+    def __init__(self, seed=None, budget=0.004):
+        self.budget = budget
+        self.autopilot: Autopilot | None = None
+        self.last_iteration = None
+
+    def __call__(self, game: Game, schedule: Schedule) -> str | None:
+        if self.autopilot is None or self.autopilot.game is not game:
+            self.autopilot = Autopilot(game, self.budget)
+        if game.current_iteration == self.last_iteration:
+            return None
+        self.last_iteration = game.current_iteration
+        return self.autopilot.choose()
+
+
+POLICIES = {
+    'idle': IdlePolicy,
+    'random': RandomPolicy,
+    'eat-above': EatAbovePolicy,
+    'autopilot': AutopilotPolicy,
+}
+
+
+def load_policy(name: str, seed=None) -> Policy:
+    # either one of POLICIES or "module:attribute" of a callable taking `seed` and returning a policy
+    if name in POLICIES:
+        return POLICIES[name](seed)
+    module_name, _, attribute = name.partition(':')
+    return getattr(import_module(module_name), attribute)(seed)
+
+
+def run_session(policy_name: str, seed: int, max_x=16, max_y=16, max_frames=100_000, record_path: str | None = None,
+                profile=False, history_path: str | None = None, check=False, **schedule_options) -> dict:
+    # plays one game without rendering or sleeping, frame by frame as the blessed front-end does;
+    # `check` verifies the board after every frame (Board.check_columns), which raises on the first mismatch
+    game = Game(max_x, max_y, seed=seed)
+    schedule = Schedule(game, **schedule_options)
+    policy = load_policy(policy_name, seed)
+    recorder = Recorder(open(record_path, 'wb'), schedule) if record_path else None
+    profiler = Profiler() if profile else None
+    history = HistoryRecorder(open(history_path, 'wb'), game) if history_path else None
+    if profiler:
+        profiler.instrument_game(game)
+
+    died = False
+    start = perf_counter()
+    try:
+        while schedule.frame < max_frames:
+            schedule.next_frame()
+            if key := policy(game, schedule):
+                schedule.press(key)
+                if recorder:
+                    recorder.record(key)
+            schedule.end_frame()
+            if history:
+                history.record()
+            if check:
+                game.board.check_columns()
+    except GameEnd:
+        died = True
+    finally:
+        if profiler:
+            profiler.disable()
+        elapsed = perf_counter() - start
+        if recorder:
+            recorder.close()
+            recorder.file.close()
+        if history:
+            history.close()
+            history.file.close()
+
+    result = {
+        'seed': seed,
+        'policy': policy_name,
+        'died': died,
+        'frames': schedule.frame,
+        'iterations': game.current_iteration,
+        'blocks_eaten': game.blocks_eaten,
+        'seconds': elapsed,
+        'seconds_per_iteration': elapsed / game.current_iteration if game.current_iteration else None,
+    }
+    if profiler:
+        result['profile'] = profiler.report()
+    return result
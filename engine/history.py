@@ -0,0 +1,183 @@
+import mmap
+import struct
+import zlib
+from array import array
+from bisect import bisect_right
+from typing import BinaryIO, Dict, Iterator, List, Tuple
+
+from engine.game import Game
+from engine.kinds import CellKinds
+
+# A history file is a header, then chunks of `ticks_per_chunk` ticks, then an index of the chunks and a footer.
+# A chunk is a header and zlib compressed columns: the visible cell kinds of every tick (uint8, row by row),
+# then player x, player y (uint16), blocks eaten and iteration (uint32) of every tick.
+# Everything is little-endian, the reader maps the columns straight from memory, so it expects
+# a little-endian host. A file that was never closed has no index, the chunk headers are walked instead.
+MAGIC = b'KRHI'
+VERSION = 1
+HEADER = struct.Struct('<4sBHHI')  # magic, version, max_x, visible rows, ticks per chunk
+CHUNK_HEADER = struct.Struct('<QII')  # first tick, ticks, compressed size
+INDEX_ENTRY = struct.Struct('<QQ')  # first tick, offset of the chunk header
+FOOTER = struct.Struct('<QI4s')  # offset of the index, number of chunks, magic
+
+
+class HistoryRecorder:
+    # Call `record()` once per tick, after Schedule.end_frame. The visible board is kept up to date from
+    # the board's change log, so a tick costs a copy of the board plus the cells that changed.
+    def __init__(self, file: BinaryIO, game: Game, ticks_per_chunk=1024, level=6):
+        self.file = file
+        self.game = game
+        self.ticks_per_chunk = ticks_per_chunk
+        self.level = level
+        self.rows = game.max_y - game.upper_lines
+        self.ticks = 0
+        self.index: List[Tuple[int, int]] = []
+
+        self.board = CellKinds(game.board, game.upper_lines)
+        self.boards = bytearray()
+        self.player_x = array('H')
+        self.player_y = array('H')
+        self.blocks_eaten = array('I')
+        self.iterations = array('I')
+
+        file.write(HEADER.pack(MAGIC, VERSION, game.max_x, self.rows, ticks_per_chunk))
+
+    def record(self):
+        game = self.game
+        self.boards += self.board.kinds
+        self.player_x.append(game.player.x)
+        self.player_y.append(max(game.player.y - game.upper_lines, 0))
+        self.blocks_eaten.append(game.blocks_eaten)
+        self.iterations.append(game.current_iteration)
+        if len(self.player_x) == self.ticks_per_chunk:
+            self.write_chunk()
+
+    def write_chunk(self):
+        ticks = len(self.player_x)
+        if not ticks:
+            return
+        columns = b''.join((self.boards, self.player_x.tobytes(), self.player_y.tobytes(),
+                            self.blocks_eaten.tobytes(), self.iterations.tobytes()))
+        compressed = zlib.compress(columns, self.level)
+        self.index.append((self.ticks, self.file.tell()))
+        self.file.write(CHUNK_HEADER.pack(self.ticks, ticks, len(compressed)))
+        self.file.write(compressed)
+        self.ticks += ticks
+        self.boards = bytearray()
+        for column in (self.player_x, self.player_y, self.blocks_eaten, self.iterations):
+            del column[:]
+
+    def close(self):
+        self.write_chunk()
+        index_offset = self.file.tell()
+        self.file.write(b''.join(INDEX_ENTRY.pack(first_tick, offset) for first_tick, offset in self.index))
+        self.file.write(FOOTER.pack(index_offset, len(self.index), MAGIC))
+        self.file.flush()
+        self.board.close()
+
+
+class History:
+    # Reads a history file through mmap. Only the chunks that are asked for are decompressed, and what is
+    # returned are memoryviews into them, e.g. `numpy.frombuffer` or `numpy.asarray` wraps them without a copy.
+    def __init__(self, path: str, cached_chunks=4):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.max_x, self.rows, self.ticks_per_chunk = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('Not a pykret history.')
+        self.cells_per_tick = self.max_x * self.rows
+        self.index = self.read_index()
+        self.first_ticks = [first_tick for first_tick, _ in self.index]
+        self.ticks = 0
+        if self.index:
+            self.ticks = self.index[-1][0] + CHUNK_HEADER.unpack_from(self.map, self.index[-1][1])[1]
+        self.cached_chunks = cached_chunks
+        self.cache: Dict[int, Dict[str, memoryview]] = {}
+
+    def read_index(self) -> List[Tuple[int, int]]:
+        size = len(self.map)
+        if size >= HEADER.size + FOOTER.size:
+            index_offset, chunks, magic = FOOTER.unpack_from(self.map, size - FOOTER.size)
+            if magic == MAGIC and index_offset + chunks * INDEX_ENTRY.size == size - FOOTER.size:
+                return [INDEX_ENTRY.unpack_from(self.map, index_offset + i * INDEX_ENTRY.size) for i in range(chunks)]
+        # not closed, walk the chunks that were written completely
+        index = []
+        offset = HEADER.size
+        while offset + CHUNK_HEADER.size <= size:
+            first_tick, ticks, compressed_size = CHUNK_HEADER.unpack_from(self.map, offset)
+            if offset + CHUNK_HEADER.size + compressed_size > size:
+                break
+            index.append((first_tick, offset))
+            offset += CHUNK_HEADER.size + compressed_size
+        return index
+
+    def __len__(self):
+        return self.ticks
+
+    def close(self):
+        self.cache.clear()
+        self.map.close()
+        self.file.close()
+
+    def chunk(self, number: int) -> Dict[str, memoryview]:
+        # columns of one chunk: 'boards' shaped (ticks, rows, max_x) and one value per tick in the others
+        columns = self.cache.get(number)
+        if columns is not None:
+            return columns
+        first_tick, offset = self.index[number]
+        _, ticks, compressed_size = CHUNK_HEADER.unpack_from(self.map, offset)
+        start = offset + CHUNK_HEADER.size
+        data = memoryview(zlib.decompress(memoryview(self.map)[start:start + compressed_size]))
+
+        boards_size = ticks * self.cells_per_tick
+        columns = {'boards': data[:boards_size].cast('B', (ticks, self.rows, self.max_x))}
+        position = boards_size
+        for name, code in (('player_x', 'H'), ('player_y', 'H'), ('blocks_eaten', 'I'), ('iterations', 'I')):
+            size = ticks * array(code).itemsize
+            columns[name] = data[position:position + size].cast(code)
+            position += size
+
+        if len(self.cache) >= self.cached_chunks:
+            del self.cache[next(iter(self.cache))]
+        self.cache[number] = columns
+        return columns
+
+    def chunk_of(self, tick: int) -> int:
+        if not 0 <= tick < self.ticks:
+            raise IndexError(f'There is no tick {tick} in the history.')
+        return bisect_right(self.first_ticks, tick) - 1
+
+    def board(self, tick: int) -> memoryview:
+        # (rows, max_x) view of the visible cell kinds
+        number = self.chunk_of(tick)
+        columns = self.chunk(number)
+        boards = columns['boards']
+        # multi-dimensional memoryviews cannot be indexed, slice the flat buffer of the chunk instead
+        flat = boards.cast('B')
+        start = (tick - self.first_ticks[number]) * self.cells_per_tick
+        return flat[start:start + self.cells_per_tick].cast('B', (self.rows, self.max_x))
+
+    def player(self, tick: int) -> Tuple[int, int, int, int]:
+        # player x, player y, blocks eaten, iteration
+        number = self.chunk_of(tick)
+        columns = self.chunk(number)
+        i = tick - self.first_ticks[number]
+        return columns['player_x'][i], columns['player_y'][i], columns['blocks_eaten'][i], columns['iterations'][i]
+
+    def ticks_range(self, start: int, stop: int) -> Iterator[Tuple[int, Dict[str, memoryview]]]:
+        # (first tick, columns) for every chunk overlapping [start, stop), each cut to that range
+        stop = min(stop, self.ticks)
+        tick = max(start, 0)
+        while tick < stop:
+            number = self.chunk_of(tick)
+            first_tick = self.first_ticks[number]
+            columns = self.chunk(number)
+            ticks = len(columns['player_x'])
+            begin, end = tick - first_tick, min(stop - first_tick, ticks)
+            flat = columns['boards'].cast('B')
+            part = {'boards': flat[begin * self.cells_per_tick:end * self.cells_per_tick]
+                    .cast('B', (end - begin, self.rows, self.max_x))}
+            for name in ('player_x', 'player_y', 'blocks_eaten', 'iterations'):
+                part[name] = columns[name][begin:end]
+            yield tick, part
+            tick = first_tick + end
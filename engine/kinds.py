@@ -0,0 +1,81 @@
+from typing import Iterator, List, Set, Tuple
+
+from engine.blocks import Block
+from engine.board import Board, cell_kind
+from engine.changes import ChangeLog, Event, changed_cells
+from engine.game import Game
+from engine.player import Player
+
+
+class CellKinds:
+    # The cell kinds (engine.board.cell_kind) of a board from `first_row` down, row by row, kept up to date from
+    # the board's change log, so a copy of the board costs the cells that changed rather than all of them.
+    # `kinds` may be a slice of a larger buffer that the caller owns, e.g. one game of a batch.
+    def __init__(self, board: Board, first_row=0, kinds: bytearray | memoryview | None = None):
+        self.board = board
+        self.first_row = first_row
+        self.kinds = kinds if kinds is not None else bytearray(board.max_x * (board.max_y - first_row))
+        self.read_board()
+        self.changes = board.enable_changes()
+        self.changes.subscribe(self.changed)
+
+    def read_board(self):
+        first_row = self.first_row
+        self.kinds[:] = bytes(cell_kind(cell_value) for _, y, cell_value in self.board.traverse_all_board_cells()
+                              if y >= first_row)
+
+    def changed(self, tick: int | None, events: List[Event]):
+        cells = changed_cells(events)
+        if cells is None:
+            self.read_board()
+            return
+        read_cell = self.board.read_cell
+        first_row, max_x, kinds = self.first_row, self.board.max_x, self.kinds
+        for x, y in cells:
+            if y >= first_row:
+                kinds[(y - first_row) * max_x + x] = cell_kind(read_cell(x, y))
+
+    def close(self):
+        self.changes.unsubscribe(self.changed)
+
+
+class DirtyCells:
+    # What a renderer has to look at for its next frame. Drawing a game, that is the board cells changed since the
+    # last frame once it `follow`s the change log, all of them otherwise; drawing engine.threaded snapshots, the
+    # rows that differ from the last snapshot. Everything counts as changed again after `invalidate`.
+    def __init__(self):
+        self.following = False
+        self.cells: Set[Tuple[int, int]] | None = None  # None means all of them
+        self.last_kinds: bytes | None = None
+
+    def follow(self, changes: ChangeLog):
+        self.following = True
+        changes.subscribe(self.changed)
+
+    def changed(self, tick: int | None, events: List[Event]):
+        if self.cells is not None:
+            cells = changed_cells(events)
+            self.cells = None if cells is None else self.cells | cells
+
+    def invalidate(self):
+        self.cells = None
+        self.last_kinds = None
+
+    def visible_cells(self, game: Game) -> Iterator[Tuple[int, int, Block | Player | None]]:
+        # (x, y, cell value) of the visible cells to draw, y counted from the first visible row; from now on
+        # the cells count as drawn
+        cells = self.cells
+        self.cells = set() if self.following else None
+        if cells is None:
+            return game.traverse_visible_board_cells()
+        read_cell = game.board.read_cell
+        upper_lines = game.upper_lines
+        return ((x, y - upper_lines, read_cell(x, y)) for x, y in cells if y >= upper_lines)
+
+    def snapshot_cells(self, max_x: int, kinds: bytes) -> Iterator[Tuple[int, int, int]]:
+        # (x, y, kind) of every cell in the rows of a snapshot's `kinds` that differ from the last snapshot
+        last_kinds = self.last_kinds
+        self.last_kinds = kinds
+        rows = [y for y, start in enumerate(range(0, len(kinds), max_x))
+                if last_kinds is None or last_kinds[start:start + max_x] != kinds[start:start + max_x]]
+        return ((x, y, kinds[y * max_x + x]) for y in rows for x in range(max_x))
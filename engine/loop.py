@@ -0,0 +1,80 @@
+import asyncio
+from typing import Awaitable, Callable
+
+from engine.game import GameEnd
+from engine.replay import Recorder
+from engine.schedule import FrameClock, Schedule
+
+
+class GameLoop:
+    # Runs a Schedule at a fixed timestep on asyncio. Keys are applied the moment they arrive, between
+    # frames, and drawing runs in its own task that only redraws the latest state, so a slow renderer
+    # skips frames instead of slowing down the game.
+    max_catch_up = 0.25  # seconds of simulation that are replayed back-to-back after a stall
+
+    def __init__(self, schedule: Schedule, render: Callable[[], None] | None = None, max_render_fps=None,
+                 recorder: Recorder | None = None):
+        self.schedule = schedule
+        self.render = render
+        self.min_render_interval = 1 / max_render_fps if max_render_fps else 0
+        self.recorder = recorder
+        self.last_key = None
+        self.running = False
+        self.game_over = False
+        self.refresh_needed = asyncio.Event()
+
+    def press(self, key: str | None):
+        if not self.running:
+            return
+        self.schedule.press(key)
+        if self.recorder:
+            self.recorder.record(key)
+        self.last_key = key
+        self.refresh_needed.set()
+
+    def stop(self):
+        self.running = False
+        self.refresh_needed.set()
+
+    async def simulate(self):
+        loop = asyncio.get_running_loop()
+        clock = FrameClock(self.schedule.fps, loop.time(), self.max_catch_up)
+        try:
+            while self.running:
+                if self.schedule.next_frame():
+                    self.refresh_needed.set()
+                self.schedule.end_frame()
+
+                now = loop.time()
+                # even when behind, yield so that input and drawing get their turn
+                await asyncio.sleep(max(clock.tick(now) - now, 0))
+        except GameEnd:
+            self.game_over = True
+        finally:
+            self.stop()
+
+    async def draw(self):
+        loop = asyncio.get_running_loop()
+        while self.running:
+            await self.refresh_needed.wait()
+            self.refresh_needed.clear()
+            if not self.running:
+                break
+            started = loop.time()
+            self.render()
+            await asyncio.sleep(max(self.min_render_interval - (loop.time() - started), 0))
+
+    async def run(self, *tasks: Awaitable) -> bool:
+        # runs until the game ends (returns True) or `stop()` is called (returns False);
+        # `tasks` run alongside, e.g. polling for input, and are cancelled at the end
+        self.running = True
+        side_tasks = [asyncio.ensure_future(task) for task in tasks]
+        if self.render:
+            side_tasks.append(asyncio.ensure_future(self.draw()))
+        try:
+            await self.simulate()
+        finally:
+            for task in side_tasks:
+                task.cancel()
+            await asyncio.gather(*side_tasks, return_exceptions=True)
+        return self.game_over
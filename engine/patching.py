@@ -0,0 +1,68 @@
+from typing import Any, Callable, Dict, List, Tuple
+
+# The wrappers installed on every patched (id(owner), attribute), innermost first, shared by all Patchers:
+# removing one from the middle rebuilds the ones above it, so tools can be enabled and disabled in any order.
+_stacks: Dict[Tuple[int, str], 'PatchStack'] = {}
+
+
+class PatchStack:
+    def __init__(self, owner: Any, attribute: str):
+        self.owner = owner
+        self.attribute = attribute
+        # an attribute only found on a class of `owner` is deleted again rather than set back
+        self.own = attribute in vars(owner)
+        self.saved = vars(owner).get(attribute)
+        self.original = getattr(owner, attribute)
+        self.patches: List['Patch'] = []
+
+    def push(self, patch: 'Patch'):
+        patch.wrapper = patch.make_wrapper(self.patches[-1].wrapper if self.patches else self.original)
+        self.patches.append(patch)
+        setattr(self.owner, self.attribute, patch.wrapper)
+
+    def remove(self, patch: 'Patch'):
+        index = self.patches.index(patch)
+        del self.patches[index]
+        inner = self.patches[index - 1].wrapper if index else self.original
+        for above in self.patches[index:]:
+            above.wrapper = above.make_wrapper(inner)
+            inner = above.wrapper
+        if self.patches:
+            setattr(self.owner, self.attribute, inner)
+        elif self.own:
+            setattr(self.owner, self.attribute, self.saved)
+        else:
+            delattr(self.owner, self.attribute)
+
+
+class Patch:
+    # `make_wrapper(inner)` returns what replaces the attribute, calling `inner` for what it replaced
+    def __init__(self, stack: PatchStack, make_wrapper: Callable[[Callable], Callable]):
+        self.stack = stack
+        self.make_wrapper = make_wrapper
+        self.wrapper: Callable | None = None
+
+
+class Patcher:
+    # Replaces methods of classes or of single objects (with a __dict__) by wrappers and puts them back on
+    # `restore`, for opt-in instrumentation such as profiling.Profiler and tracing.InputTracer.
+    def __init__(self):
+        self.patches: List[Patch] = []
+
+    def patch(self, owner: Any, attribute: str, make_wrapper: Callable[[Callable], Callable]):
+        key = (id(owner), attribute)
+        stack = _stacks.get(key)
+        if stack is None:
+            stack = _stacks[key] = PatchStack(owner, attribute)
+        patch = Patch(stack, make_wrapper)
+        stack.push(patch)
+        self.patches.append(patch)
+
+    def restore(self):
+        # only the wrappers of this Patcher, those of others stay in place
+        for patch in reversed(self.patches):
+            stack = patch.stack
+            stack.remove(patch)
+            if not stack.patches:
+                del _stacks[id(stack.owner), stack.attribute]
+        self.patches.clear()
@@ -1,18 +1,29 @@
 from typing import List
 
-from engine.blocks import Block
+from engine.blocks import Block, Shape
 from engine.point import Point2D
 
 
 class Player:
+    __slots__ = ('game', 'x', 'y', 'char')
+    shape = Shape((0, 0))
+
     def __init__(self, game, x, y):
         self.game = game
-        self.location: List[Point2D] = [Point2D(x, y)]
+        self.x = x
+        self.y = y
         self.char = 'K'
 
+    @property
+    def location(self) -> List[Point2D]:
+        return [Point2D(self.x, self.y)]
+
     def move_x(self, dx):
-        new_p_x = self.location[0].x + dx
-        new_p_y = self.location[0].y
+        # a crushed player keeps still until the next frame ends the game, its cell belongs to the block now
+        if self.is_dead():
+            return
+        new_p_x = self.x + dx
+        new_p_y = self.y
         try:
             cell_value = self.game.board.read_cell(new_p_x, new_p_y)
         except IndexError:
@@ -25,8 +36,16 @@ class Player:
             self.game.board.move_object(self, dx, 0)
 
     def move_y(self, dy):
-        new_p_x = self.location[0].x
-        new_p_y = self.location[0].y + dy
+        if self.is_dead():
+            return
+        new_p_x = self.x
+        new_p_y = self.y + dy
+        if dy > 0:
+            # falling, the skyline tells whether a block is in the way
+            board = self.game.board
+            if new_p_y < board.max_y and not board.has_block(new_p_x, new_p_y):
+                board.move_object(self, 0, dy)
+            return
         try:
             cell_value = self.game.board.read_cell(new_p_x, new_p_y)
         except IndexError:
@@ -40,8 +59,7 @@ class Player:
             self.game.board.move_object(self, 0, dy)
 
     def is_dead(self):
-        player_location = self.location[0]
-        cell_value = self.game.board.read_cell(player_location.x, player_location.y)
+        cell_value = self.game.board.read_cell(self.x, self.y)
         if isinstance(cell_value, Player):
             return False
         else:
@@ -0,0 +1,74 @@
+import mmap
+import struct
+from array import array
+from typing import BinaryIO, Dict, Iterable, Sequence, Tuple
+
+from engine.game import Game, pack_board, unpack_board
+
+# A pool file holds prebuilt starting boards: a header, an index of (board size, seed) and then one record per
+# board, its cells and blocks stored the way Game.save does (engine.game.pack_board) and the state of the game's
+# random generator right after the board was built. Loading a record therefore leaves the game exactly where
+# `Game(max_x, max_y, seed=seed)` would start.
+MAGIC = b'KRPL'
+VERSION = 3
+HEADER = struct.Struct('<4sBI')  # magic, version, number of boards
+INDEX_ENTRY = struct.Struct('<HHQQ')  # max_x, max_y (without the upper lines), seed, offset of the record
+RECORD_HEADER = struct.Struct('<BI')  # bytes per block id, number of blocks
+RANDOM_STATE_SIZE = 625  # words of a Mersenne Twister state, the last one is its position
+
+
+def write_pool(file: BinaryIO, sizes: Iterable[Tuple[int, int]], seeds: Sequence[int]):
+    keys = []
+    records = []
+    for max_x, max_y in sizes:
+        for seed in seeds:
+            game = Game(max_x, max_y, seed=seed)
+            # the seed as the game keeps it, which is what `load` looks up
+            keys.append((max_x, max_y, game.seed))
+            # `load` leaves the cell of the player empty, Game.__init__ adds the player after the pool
+            id_size, block_count, board = pack_board(game.board, game.player)
+            records.append(b''.join((RECORD_HEADER.pack(id_size, block_count), board,
+                                     array('I', game.random.getstate()[1]).tobytes())))
+
+    offset = HEADER.size + len(keys) * INDEX_ENTRY.size
+    file.write(HEADER.pack(MAGIC, VERSION, len(keys)))
+    for key, record in zip(keys, records):
+        file.write(INDEX_ENTRY.pack(*key, offset))
+        offset += len(record)
+    for record in records:
+        file.write(record)
+
+
+class BoardPool:
+    # Reads a pool file through mmap, a board is filled in one go like Game.load does. Pass it as `Game(pool=...)`.
+    def __init__(self, path: str):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, boards = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('Not a pykret board pool.')
+        self.index: Dict[Tuple[int, int, int], int] = {}
+        for i in range(boards):
+            max_x, max_y, seed, offset = INDEX_ENTRY.unpack_from(self.map, HEADER.size + i * INDEX_ENTRY.size)
+            self.index[max_x, max_y, seed] = offset
+
+    def __contains__(self, key: Tuple[int, int, int]):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def load(self, game: Game) -> bool:
+        # builds the starting board of `game` when the pool has it
+        offset = self.index.get((game.max_x, game.max_y - game.upper_lines, game.seed))
+        if offset is None:
+            return False
+        id_size, block_count = RECORD_HEADER.unpack_from(self.map, offset)
+        offset = unpack_board(self.map, offset + RECORD_HEADER.size, game.board, id_size, block_count)
+        state = array('I', self.map[offset:offset + RANDOM_STATE_SIZE * 4])
+        game.random.setstate((3, tuple(state), None))
+        return True
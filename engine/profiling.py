@@ -0,0 +1,126 @@
+import json
+from time import perf_counter_ns
+from typing import Any, Callable, Dict, List
+
+from engine.game import Game
+from engine.patching import Patcher
+from engine.player import Player
+
+
+class Histogram:
+    # latencies in power of two buckets of microseconds, bucket i holds [2 ** (i - 1), 2 ** i) us
+    size = 32
+
+    def __init__(self):
+        self.calls = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.buckets = [0] * self.size
+
+    def add(self, ns: int):
+        self.calls += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+        self.buckets[min((ns // 1000).bit_length(), self.size - 1)] += 1
+
+    def percentile(self, fraction: float) -> float:
+        # upper bound of the bucket the percentile falls into, in microseconds
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= fraction * self.calls:
+                return float(1 << bucket)
+        return 0.0
+
+    def report(self) -> dict:
+        return {
+            'calls': self.calls,
+            'total_ms': self.total_ns / 1e6,
+            'mean_us': self.total_ns / self.calls / 1e3 if self.calls else 0.0,
+            'max_us': self.max_ns / 1e3,
+            'p50_us': self.percentile(0.5),
+            'p99_us': self.percentile(0.99),
+            'buckets_us': {1 << bucket: count for bucket, count in enumerate(self.buckets) if count},
+        }
+
+
+class Profiler:
+    # Opt-in instrumentation: `wrap` replaces a method of a class or of a single object by a timing wrapper
+    # and `disable` puts the originals back, so nothing is measured, and nothing costs, until it is enabled.
+    def __init__(self):
+        self.counters: Dict[str, int] = {}
+        self.timings: Dict[str, Histogram] = {}
+        self.patcher = Patcher()
+
+    def count(self, name: str, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def histogram(self, name: str) -> Histogram:
+        histogram = self.timings.get(name)
+        if histogram is None:
+            histogram = self.timings[name] = Histogram()
+        return histogram
+
+    def wrap(self, owner: Any, attribute: str, name: str | None = None, after: Callable[[], None] | None = None):
+        # `owner` is a class (every instance is measured) or an object with a __dict__ (only that one);
+        # a raised exception counts as `<name>.failed`
+        name = name or attribute
+        histogram = self.histogram(name)
+        count = self.count
+
+        def make_wrapper(original):
+            def wrapper(*args, **kwargs):
+                start = perf_counter_ns()
+                try:
+                    return original(*args, **kwargs)
+                except Exception:
+                    count(f'{name}.failed')
+                    raise
+                finally:
+                    histogram.add(perf_counter_ns() - start)
+                    if after:
+                        after()
+            return wrapper
+
+        self.patcher.patch(owner, attribute, make_wrapper)
+
+    def instrument_game(self, game: Game):
+        board = game.board
+
+        def count_iteration():
+            checked = game.checked_blocks
+            self.count('next_iteration.blocks_checked', len(checked))
+            self.count('next_iteration.blocks_moved', sum(block.age_not_in_motion == 0 for block in checked))
+
+        self.wrap(game, 'generate_new_block')
+        # generate_new_block only adds a block that fits, calls without an add_object found no room
+        self.wrap(board, 'add_object', 'board.add_object')
+        self.wrap(game, 'destroy_static_block')
+        self.wrap(game, 'next_iteration', after=count_iteration)
+        # Player has __slots__, so the class itself is instrumented
+        self.wrap(Player, 'move_x', 'player.move_x')
+        self.wrap(Player, 'move_y', 'player.move_y')
+
+    def disable(self):
+        self.patcher.restore()
+
+    def report(self) -> dict:
+        return {
+            'counters': dict(self.counters),
+            'timings': {name: histogram.report() for name, histogram in self.timings.items()},
+        }
+
+    def dump(self, path: str):
+        with open(path, 'w') as file:
+            json.dump(self.report(), file, indent=2)
+
+    def summary_lines(self) -> List[str]:
+        # copies, the measured code may run on another thread and add names meanwhile
+        lines = [f'{"":<34}{"calls":>8}{"mean us":>10}{"p99 us":>10}']
+        for name, histogram in list(self.timings.items()):
+            if histogram.calls:
+                lines.append(f'{name:<34}{histogram.calls:>8}{histogram.total_ns / histogram.calls / 1e3:>10.1f}'
+                             f'{histogram.percentile(0.99):>10.0f}')
+        lines.extend(f'{name:<34}{value:>8}' for name, value in list(self.counters.items()))
+        return lines
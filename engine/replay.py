@@ -0,0 +1,115 @@
+import struct
+from typing import BinaryIO, Callable, List, Tuple
+
+from engine.game import Game, GameEnd
+from engine.schedule import KEY_LEFT, KEY_RIGHT, KEY_UP, Schedule
+
+# A recording is a fixed header followed by (frame delta as LEB128 varint, key code byte) records.
+# Key code END closes the recording and carries the last played frame; without it a recording ends at its last input.
+MAGIC = b'KRET'
+VERSION = 1
+HEADER = struct.Struct('<4sBHHQHHHH')
+
+END = 0
+OTHER_KEY = 255
+KEY_CODES = {KEY_LEFT: 1, KEY_RIGHT: 2, KEY_UP: 3}
+KEYS_BY_CODE = {code: key for key, code in KEY_CODES.items()}
+
+
+def write_varint(value: int) -> bytes:
+    out = bytearray()
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def read_varint(data: bytes, position: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+class Recorder:
+    def __init__(self, file: BinaryIO, schedule: Schedule):
+        self.file = file
+        self.schedule = schedule
+        self.last_frame = 0
+
+        game = schedule.game
+        file.write(HEADER.pack(MAGIC, VERSION, game.max_x, game.max_y - game.upper_lines, game.seed,
+                               schedule.fps, schedule.game_speed_multiplier,
+                               schedule.frames_per_new_block, schedule.frames_until_player_fall))
+
+    def write(self, frame: int, code: int):
+        self.file.write(write_varint(frame - self.last_frame) + bytes((code,)))
+        self.last_frame = frame
+
+    def record(self, key: str | None):
+        # call with every key passed to Schedule.press, in the same frame
+        self.write(self.schedule.frame, KEY_CODES.get(key, OTHER_KEY))
+
+    def close(self):
+        self.write(self.schedule.frame, END)
+        self.file.flush()
+
+
+class Replay:
+    def __init__(self, data: bytes):
+        (magic, version, self.max_x, self.max_y, self.seed, self.fps, self.game_speed_multiplier,
+         self.frames_per_new_block, self.frames_until_player_fall) = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('Not a pykret recording.')
+
+        self.inputs: List[Tuple[int, str | None]] = []
+        self.last_frame = 0
+        position, frame = HEADER.size, 0
+        while position < len(data):
+            delta, position = read_varint(data, position)
+            code = data[position]
+            position += 1
+            frame += delta
+            if code == END:
+                self.last_frame = frame
+                break
+            self.inputs.append((frame, KEYS_BY_CODE.get(code)))
+        else:
+            # cut off before END (the game was killed): play until the last input
+            self.last_frame = frame
+
+    @classmethod
+    def load(cls, path: str) -> 'Replay':
+        with open(path, 'rb') as file:
+            return cls(file.read())
+
+    def new_game(self) -> Tuple[Game, Schedule]:
+        game = Game(self.max_x, self.max_y, seed=self.seed)
+        schedule = Schedule(game, fps=self.fps, game_speed_multiplier=self.game_speed_multiplier,
+                            frames_per_new_block=self.frames_per_new_block,
+                            frames_until_player_fall=self.frames_until_player_fall)
+        return game, schedule
+
+    def run(self, on_frame: Callable[[Schedule], None] | None = None) -> Game:
+        # re-executes the recording without any waiting
+        game, schedule = self.new_game()
+        inputs = iter(self.inputs)
+        next_input = next(inputs, None)
+        try:
+            while schedule.frame < self.last_frame:
+                schedule.next_frame()
+                # an input recorded before the first frame (frame 0) is applied in it rather than never
+                while next_input is not None and next_input[0] <= schedule.frame:
+                    schedule.press(next_input[1])
+                    next_input = next(inputs, None)
+                schedule.end_frame()
+                if on_frame:
+                    on_frame(schedule)
+        except GameEnd:
+            pass
+        return game
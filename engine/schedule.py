@@ -0,0 +1,84 @@
+from engine.game import Game, GameEnd
+
+KEY_LEFT = 'KEY_LEFT'
+KEY_RIGHT = 'KEY_RIGHT'
+KEY_UP = 'KEY_UP'
+
+
+def calculate_new_frames_per_iteration(frames_per_iteration):
+    return frames_per_iteration // 2
+
+
+class Schedule:
+    # Frame based timing of a game: when it iterates, spawns blocks, speeds up and when the player falls.
+    # A frame is `next_frame()`, then `press()` for every key read during the frame, then `end_frame()`.
+    def __init__(self, game: Game, fps=100, game_speed_multiplier=1, frames_per_new_block=6,
+                 frames_until_player_fall=100):
+        self.game = game
+        self.fps = fps
+        self.game_speed_multiplier = game_speed_multiplier
+        self.frames_per_iteration = fps // game_speed_multiplier
+        self.frames_per_new_block = frames_per_new_block
+        self.frames_per_block_speed_change = 3 * self.frames_per_iteration
+        self.frames_until_player_fall = frames_until_player_fall  # TODO: needs to be relative to iteration speed
+        self.last_up_movement_frame = 0
+        self.last_movement_frame = 0
+        self.frame = 0
+
+    def next_frame(self) -> bool:
+        self.frame += 1
+        refresh_needed = False
+
+        if self.game.player.is_dead():
+            raise GameEnd()
+
+        if (self.frame - self.last_movement_frame) % self.frames_per_iteration == 0:
+            if (self.frame // self.frames_per_iteration) % self.frames_per_new_block:
+                self.game.generate_new_block()
+            self.game.destroy_static_block()
+            self.game.next_iteration()
+            refresh_needed = True
+
+        if (self.frame - self.last_up_movement_frame) % self.frames_until_player_fall == 0:
+            self.game.player.move_y(1)
+            refresh_needed = True
+
+        return refresh_needed
+
+    def press(self, key: str):
+        if key == KEY_RIGHT:
+            self.game.player.move_x(1)
+        if key == KEY_LEFT:
+            self.game.player.move_x(-1)
+        if key == KEY_UP:
+            self.game.player.move_y(-1)
+            self.last_up_movement_frame = self.frame
+        self.last_movement_frame = self.frame + 1  # That's tricky, because it will force the next iteration
+
+    def end_frame(self):
+        if self.game.board.changes is not None:
+            self.game.board.changes.flush(self.frame)
+        if self.frame % self.frames_per_block_speed_change == 0:
+            new_frames_per_iteration = calculate_new_frames_per_iteration(self.frames_per_iteration)
+            if new_frames_per_iteration > 0:
+                self.frames_per_iteration = new_frames_per_iteration
+
+
+class FrameClock:
+    # Fixed timestep pacing for the loops that run frames in real time. After a frame, `tick(now)` gives when
+    # the next one is due; after a stall of more than `max_catch_up` seconds the missed frames are dropped
+    # instead of being replayed back-to-back. Any clock works as long as `now` always comes from it.
+    def __init__(self, fps: int, now: float, max_catch_up=0.25):
+        self.frame_length = 1 / fps
+        self.max_catch_up = max_catch_up
+        self.next_frame_at = now
+        # frames that started later than one frame length after they were due
+        self.late_frames = 0
+
+    def tick(self, now: float) -> float:
+        self.next_frame_at += self.frame_length
+        if now > self.next_frame_at:
+            self.late_frames += 1
+            if self.next_frame_at < now - self.max_catch_up:
+                self.next_frame_at = now
+        return self.next_frame_at
@@ -0,0 +1,221 @@
+import asyncio
+import struct
+from typing import Dict, List, Set, Tuple
+
+from engine.board import cell_kind
+from engine.changes import Event, changed_cells
+from engine.game import Game, GameEnd
+from engine.pool import BoardPool
+from engine.replay import KEYS_BY_CODE
+from engine.schedule import FrameClock, Schedule
+
+# Every message is a little-endian uint32 length and then the body, whose first byte is the message type.
+# client -> server: PLAY (host a new game for me), WATCH + uint32 session id, KEY + key code of replay.KEY_CODES
+# server -> client: BOARD with the whole visible board, DELTA with the cells changed by one tick, END
+LENGTH = struct.Struct('<I')
+PLAY = ord('P')
+WATCH = ord('W')
+KEY = ord('K')
+BOARD = ord('B')
+DELTA = ord('D')
+END = ord('E')
+
+BOARD_HEADER = struct.Struct('<BIIHH')  # type, session id, tick, max_x, visible max_y; then one kind per cell
+DELTA_HEADER = struct.Struct('<BIH')  # type, tick, number of changes
+CHANGE = struct.Struct('<HHB')  # x, y, kind
+END_BODY = struct.Struct('<BII')  # type, tick, blocks eaten
+WATCH_BODY = struct.Struct('<BI')
+KEY_BODY = struct.Struct('<BB')
+# shortest body of every client message type, a client sending less is dropped
+CLIENT_BODY_SIZES = {PLAY: 1, WATCH: WATCH_BODY.size, KEY: KEY_BODY.size}
+
+
+def frame(body: bytes) -> bytes:
+    return LENGTH.pack(len(body)) + body
+
+
+async def read_message(reader: asyncio.StreamReader) -> bytes:
+    length, = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+    return await reader.readexactly(length)
+
+
+async def read_client_message(reader: asyncio.StreamReader) -> bytes:
+    body = await read_message(reader)
+    if not body or len(body) < CLIENT_BODY_SIZES.get(body[0], 1):
+        raise ConnectionError('Malformed message.')
+    return body
+
+
+def decode_board(body: bytes) -> Tuple[int, int, int, int, bytes]:
+    _, session_id, tick, max_x, max_y = BOARD_HEADER.unpack_from(body)
+    return session_id, tick, max_x, max_y, body[BOARD_HEADER.size:]
+
+
+def decode_delta(body: bytes) -> Tuple[int, List[Tuple[int, int, int]]]:
+    _, tick, count = DELTA_HEADER.unpack_from(body)
+    return tick, [CHANGE.unpack_from(body, DELTA_HEADER.size + i * CHANGE.size) for i in range(count)]
+
+
+class Client:
+    def __init__(self, writer: asyncio.StreamWriter, max_buffer: int):
+        self.writer = writer
+        self.max_buffer = max_buffer
+        # deltas were dropped, the next message has to be the whole board
+        self.stale = False
+
+    def send(self, session: 'Session', delta: bytes):
+        # A slow client is not waited for: while its unsent data is over `max_buffer`, ticks are dropped,
+        # and once it has caught up it gets the whole board instead of the deltas it missed.
+        transport = self.writer.transport
+        if transport.is_closing():
+            return
+        if transport.get_write_buffer_size() > self.max_buffer:
+            self.stale = True
+        elif self.stale:
+            self.writer.write(session.board_message())
+            self.stale = False
+        else:
+            self.writer.write(delta)
+
+
+class Session:
+    # one hosted game, its player and spectators
+    def __init__(self, session_id: int, game: Game, schedule: Schedule):
+        self.session_id = session_id
+        self.game = game
+        self.schedule = schedule
+        self.player: Client | None = None
+        self.clients: Set[Client] = set()
+        self.over = False
+        # cells changed since the last delta, None when the whole board has to be sent
+        self.dirty: Set[Tuple[int, int]] | None = set()
+        game.board.enable_changes().subscribe(self.changed)
+
+    def changed(self, tick: int | None, events: List[Event]):
+        if self.dirty is not None:
+            cells = changed_cells(events)
+            if cells is None:
+                self.dirty = None
+            else:
+                self.dirty |= cells
+
+    def board_message(self) -> bytes:
+        game = self.game
+        kinds = bytes(cell_kind(cell_value) for _, _, cell_value in game.traverse_visible_board_cells())
+        return frame(BOARD_HEADER.pack(BOARD, self.session_id, self.schedule.frame, game.max_x,
+                                       game.max_y - game.upper_lines) + kinds)
+
+    def delta_message(self) -> bytes | None:
+        # either a delta or, after a reset, the whole board
+        if self.dirty is None:
+            self.dirty = set()
+            return self.board_message()
+        if not self.dirty:
+            return None
+        game = self.game
+        read_cell = game.board.read_cell
+        upper_lines = game.upper_lines
+        changes = [CHANGE.pack(x, y - upper_lines, cell_kind(read_cell(x, y)))
+                   for x, y in self.dirty if y >= upper_lines]
+        self.dirty.clear()
+        if not changes:
+            return None
+        return frame(DELTA_HEADER.pack(DELTA, self.schedule.frame, len(changes)) + b''.join(changes))
+
+    def end_message(self) -> bytes:
+        return frame(END_BODY.pack(END, self.schedule.frame, self.game.blocks_eaten))
+
+
+class GameServer:
+    # Hosts many games in one process. A single task runs the frames of all of them at a fixed timestep,
+    # like GameLoop does for one game, and every frame that changed a board sends one delta message,
+    # encoded once and written to the player and every spectator of that game.
+    max_catch_up = 0.25
+
+    def __init__(self, max_x=16, max_y=16, seed: int | None = None, fps=100, max_buffer=1 << 16,
+                 pool: BoardPool | None = None, **schedule_options):
+        # with a `seed`, the game of session n is seeded with seed + n and its starting board may come from `pool`
+        self.max_x = max_x
+        self.max_y = max_y
+        self.seed = seed
+        self.fps = fps
+        self.max_buffer = max_buffer
+        self.pool = pool
+        self.schedule_options = schedule_options
+        self.sessions: Dict[int, Session] = {}
+        self.next_session_id = 1
+        self.ticks = 0
+
+    def new_session(self) -> Session:
+        session_id = self.next_session_id
+        self.next_session_id += 1
+        game = Game(self.max_x, self.max_y, seed=self.seed + session_id if self.seed is not None else None,
+                    pool=self.pool)
+        schedule = Schedule(game, fps=self.fps, **self.schedule_options)
+        session = self.sessions[session_id] = Session(session_id, game, schedule)
+        return session
+
+    def end_session(self, session: Session):
+        session.over = True
+        self.sessions.pop(session.session_id, None)
+        message = session.end_message()
+        for client in session.clients:
+            client.writer.write(message)
+            client.writer.close()
+
+    def tick(self):
+        self.ticks += 1
+        for session in list(self.sessions.values()):
+            schedule = session.schedule
+            try:
+                schedule.next_frame()
+            except GameEnd:
+                self.end_session(session)
+                continue
+            # the frame's changes reach the session when end_frame flushes them
+            schedule.end_frame()
+            if (delta := session.delta_message()) is not None:
+                for client in session.clients:
+                    client.send(session, delta)
+
+    async def run_ticks(self):
+        loop = asyncio.get_running_loop()
+        clock = FrameClock(self.fps, loop.time(), self.max_catch_up)
+        while True:
+            self.tick()
+            now = loop.time()
+            await asyncio.sleep(max(clock.tick(now) - now, 0))
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client = Client(writer, self.max_buffer)
+        session = None
+        try:
+            body = await read_client_message(reader)
+            if body[0] == PLAY:
+                session = self.new_session()
+                session.player = client
+            elif body[0] == WATCH:
+                session = self.sessions.get(WATCH_BODY.unpack_from(body)[1])
+            if session is None:
+                return
+            session.clients.add(client)
+            writer.write(session.board_message())
+
+            while True:
+                body = await read_client_message(reader)
+                if body[0] == KEY and session.player is client and not session.over:
+                    # applied between frames, the same as a key of a local game
+                    session.schedule.press(KEYS_BY_CODE.get(body[1]))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if session is not None:
+                session.clients.discard(client)
+                if session.player is client and not session.over:
+                    self.end_session(session)
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765):
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await asyncio.gather(server.serve_forever(), self.run_ticks())
@@ -0,0 +1,126 @@
+import threading
+from queue import Empty, SimpleQueue
+from time import perf_counter
+from typing import Callable, NamedTuple
+
+from engine.game import Game, GameEnd
+from engine.kinds import CellKinds
+from engine.replay import Recorder
+from engine.schedule import FrameClock, Schedule
+
+STOP = object()
+
+
+class FrameSnapshot(NamedTuple):
+    # everything a renderer draws, `kinds` are the visible cells (engine.board.cell_kind) row by row
+    frame: int
+    iteration: int
+    blocks_eaten: int
+    frames_per_iteration: int
+    last_key: str | None
+    max_x: int
+    rows: int
+    kinds: bytes
+    game_over: bool
+    inputs: int  # keys applied before it, e.g. to tell which ones a drawn frame shows
+
+
+class SnapshotBuffer:
+    # The back buffer is the simulation's own copy of the visible cells, kept up to date from the board's
+    # change log; `publish` freezes it into the front buffer, an immutable FrameSnapshot. Swapping the front
+    # is a single reference assignment, so readers never lock and never see a half written frame.
+    def __init__(self, game: Game):
+        self.game = game
+        self.back = CellKinds(game.board, game.upper_lines)
+        self.front: FrameSnapshot | None = None
+        self.published = threading.Event()
+
+    def close(self):
+        self.back.close()
+
+    def publish(self, schedule: Schedule, last_key: str | None, inputs: int, game_over=False):
+        game = self.game
+        self.front = FrameSnapshot(schedule.frame, game.current_iteration, game.blocks_eaten,
+                                   schedule.frames_per_iteration, last_key, game.max_x,
+                                   game.max_y - game.upper_lines, bytes(self.back.kinds), game_over, inputs)
+        self.published.set()
+
+    def wait(self, timeout: float | None = None) -> FrameSnapshot | None:
+        # the latest snapshot, once one was published since the last call (or the timeout passed)
+        self.published.wait(timeout)
+        self.published.clear()
+        return self.front
+
+
+class SimulationThread(threading.Thread):
+    # Runs a Schedule at a fixed timestep on its own thread, so however long drawing takes, it never delays
+    # a tick. Only this thread touches the game: keys are queued by `press` and applied the moment they arrive,
+    # between frames, and renderers draw `buffer.front`. `policy` (see engine.headless) runs here too.
+    max_catch_up = 0.25
+
+    def __init__(self, schedule: Schedule, recorder: Recorder | None = None,
+                 policy: Callable[[Game, Schedule], str | None] | None = None):
+        super().__init__(name='simulation', daemon=True)
+        self.schedule = schedule
+        self.game = schedule.game
+        self.recorder = recorder
+        self.policy = policy
+        self.keys: SimpleQueue = SimpleQueue()
+        self.last_key = None
+        self.keys_applied = 0
+        self.running = True
+        self.game_over = False
+        # pacing of the running thread, e.g. how many frames were late
+        self.clock: FrameClock | None = None
+
+        self.changes = self.game.board.enable_changes()
+        self.buffer = SnapshotBuffer(self.game)
+        self.buffer.publish(schedule, None, 0)
+
+    def press(self, key: str | None):
+        # from any thread
+        self.keys.put(key)
+
+    def stop(self):
+        self.keys.put(STOP)
+
+    def apply_key(self, key: str | None):
+        self.schedule.press(key)
+        if self.recorder:
+            self.recorder.record(key)
+        self.last_key = key
+        self.keys_applied += 1
+        self.changes.flush(self.schedule.frame)
+        self.buffer.publish(self.schedule, key, self.keys_applied)
+
+    def wait_for_frame(self, frame_at: float):
+        while self.running:
+            remaining = frame_at - perf_counter()
+            try:
+                key = self.keys.get(timeout=remaining) if remaining > 0 else self.keys.get_nowait()
+            except Empty:
+                return
+            if key is STOP:
+                self.running = False
+            else:
+                self.apply_key(key)
+
+    def run(self):
+        schedule = self.schedule
+        self.clock = clock = FrameClock(schedule.fps, perf_counter(), self.max_catch_up)
+        try:
+            while self.running:
+                refresh_needed = schedule.next_frame()
+                # within the frame, as run_session does, so that a recording replays the key in this frame
+                if self.policy and (key := self.policy(self.game, schedule)):
+                    self.apply_key(key)
+                schedule.end_frame()
+                if refresh_needed:
+                    self.buffer.publish(schedule, self.last_key, self.keys_applied)
+                self.wait_for_frame(clock.tick(perf_counter()))
+        except GameEnd:
+            self.game_over = True
+        finally:
+            self.running = False
+            self.buffer.close()
+            self.buffer.publish(schedule, self.last_key, self.keys_applied, self.game_over)
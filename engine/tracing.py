@@ -0,0 +1,259 @@
+import asyncio
+import json
+import random
+from collections import deque
+from statistics import pstdev
+from time import perf_counter, perf_counter_ns, sleep
+from typing import Any, Callable, Deque, List, Tuple
+
+from engine.board import cell_kind
+from engine.game import Game
+from engine.loop import GameLoop
+from engine.patching import Patcher
+from engine.player import Player
+from engine.schedule import KEY_LEFT, KEY_RIGHT, KEY_UP, Schedule
+from engine.threaded import FrameSnapshot, SimulationThread
+
+# an input as it goes through the game: key, then perf_counter_ns when it was received, when the first
+# Player.move_x/move_y call handling it started and when the first frame showing it was drawn (None if never)
+KEY, RECEIVED, MOVED, DISPLAYED = range(4)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    # nearest rank of the sorted values, latencies are kept one by one as profiling.Histogram is too coarse for them
+    values = sorted(values)
+    return values[min(int(fraction * len(values)), len(values) - 1)] if values else 0.0
+
+
+def summary(values_ns: List[int]) -> dict:
+    values = [ns / 1e6 for ns in values_ns]
+    return {
+        'count': len(values),
+        'mean_ms': sum(values) / len(values) if values else 0.0,
+        'p50_ms': percentile(values, 0.5),
+        'p99_ms': percentile(values, 0.99),
+        'max_ms': max(values, default=0.0),
+        'jitter_ms': pstdev(values) if len(values) > 1 else 0.0,
+    }
+
+
+def intervals(times_ns: List[int]) -> List[int]:
+    return [later - earlier for earlier, later in zip(times_ns, times_ns[1:])]
+
+
+class InputTracer:
+    # Opt-in like profiling.Profiler, `instrument` patches and `disable` puts the originals back.
+    # An input is received when the front-end hands it over (`entry.press`), handled by Schedule.press, where
+    # the first Player.move_x/move_y call is its move, and displayed by the first draw showing the state after it.
+    # Keys are matched to their receipt in order, so every key has to come in through `entry`.
+    def __init__(self):
+        self.inputs: List[list] = []
+        self.received: Deque[list] = deque()
+        self.handled: List[list] = []
+        self.handling: list | None = None
+        self.displayed = 0  # of the handled inputs, how many a drawn frame showed already
+        # when every draw finished and how long it took, frames are only drawn when something changed
+        self.frame_times: List[int] = []
+        self.draw_times: List[int] = []
+        self.tick_times: List[int] = []  # when every simulated frame ended
+        self.patcher = Patcher()
+
+    def receive(self, key: str | None, queued=True) -> list:
+        record = [key, perf_counter_ns(), None, None]
+        self.inputs.append(record)
+        if queued:
+            self.received.append(record)
+        return record
+
+    def instrument(self, schedule: Schedule, entry: Any, draw_owner: Any, draw_attribute: str,
+                   inputs: Callable[..., int] | None = None):
+        # `entry.press` is where the front-end hands keys over; `inputs`, called with the arguments of the draw,
+        # tells how many handled inputs that frame shows, by default all that were handled before it started
+        def wrap_entry(original):
+            def press(key, *args, **kwargs):
+                self.receive(key)
+                return original(key, *args, **kwargs)
+            return press
+
+        def wrap_press(original):
+            def press(key):
+                # a key pressed on the schedule directly, e.g. by a policy, is received as it is handled
+                record = self.received.popleft() if self.received else self.receive(key, queued=False)
+                self.handling = record
+                try:
+                    return original(key)
+                finally:
+                    self.handling = None
+                    self.handled.append(record)
+            return press
+
+        def wrap_move(original):
+            def move(player, delta):
+                record = self.handling
+                if record is not None and record[MOVED] is None:
+                    record[MOVED] = perf_counter_ns()
+                return original(player, delta)
+            return move
+
+        def wrap_end_frame(original):
+            def end_frame():
+                original()
+                self.tick_times.append(perf_counter_ns())
+            return end_frame
+
+        def wrap_draw(original):
+            def draw(*args, **kwargs):
+                shown = inputs(*args, **kwargs) if inputs else len(self.handled)
+                start = perf_counter_ns()
+                result = original(*args, **kwargs)
+                now = perf_counter_ns()
+                self.frame_times.append(now)
+                self.draw_times.append(now - start)
+                for record in self.handled[self.displayed:shown]:
+                    record[DISPLAYED] = now
+                self.displayed = max(self.displayed, shown)
+                return result
+            return draw
+
+        self.patcher.patch(entry, 'press', wrap_entry)
+        self.patcher.patch(schedule, 'press', wrap_press)
+        # Player has __slots__, so the class itself is patched
+        self.patcher.patch(Player, 'move_x', wrap_move)
+        self.patcher.patch(Player, 'move_y', wrap_move)
+        self.patcher.patch(schedule, 'end_frame', wrap_end_frame)
+        self.patcher.patch(draw_owner, draw_attribute, wrap_draw)
+
+    def instrument_loop(self, game_loop: GameLoop):
+        # the render of a GameLoop reads the game itself, so it shows every key handled before it
+        self.instrument(game_loop.schedule, game_loop, game_loop, 'render')
+
+    def instrument_simulation(self, simulation: SimulationThread, draw_owner: Any, draw_attribute: str):
+        # the draw gets a snapshot, which shows the keys applied before it was published
+        self.instrument(simulation.schedule, simulation, draw_owner, draw_attribute,
+                        inputs=lambda snapshot, *args, **kwargs: snapshot.inputs)
+
+    def disable(self):
+        self.patcher.restore()
+
+    def report(self) -> dict:
+        # copies, the simulation may still run on another thread
+        inputs = [list(record) for record in self.inputs]
+        moved = [record for record in inputs if record[MOVED] is not None]
+        shown = [record for record in moved if record[DISPLAYED] is not None]
+        return {
+            'inputs': len(inputs),
+            'moved': len(moved),
+            'displayed': len(shown),
+            'input_to_move': summary([record[MOVED] - record[RECEIVED] for record in moved]),
+            'input_to_display': summary([record[DISPLAYED] - record[RECEIVED] for record in shown]),
+            'frame_time': summary(intervals(list(self.frame_times))),
+            'draw_time': summary(list(self.draw_times)),
+            'tick_time': summary(intervals(list(self.tick_times))),
+        }
+
+    def dump(self, path: str):
+        with open(path, 'w') as file:
+            json.dump(self.report(), file, indent=2)
+
+    def summary_lines(self) -> List[str]:
+        return report_lines(self.report())
+
+
+def report_lines(report: dict) -> List[str]:
+    lines = [f'inputs {report["inputs"]}, moved {report["moved"]}, displayed {report["displayed"]}',
+             f'{"ms":<20}{"p50":>8}{"p99":>8}{"max":>8}{"jitter":>8}']
+    for name in ('input_to_move', 'input_to_display', 'frame_time', 'draw_time', 'tick_time'):
+        stats = report[name]
+        lines.append(f'{name:<20}{stats["p50_ms"]:>8.2f}{stats["p99_ms"]:>8.2f}{stats["max_ms"]:>8.2f}'
+                     f'{stats["jitter_ms"]:>8.2f}')
+    return lines
+
+
+def synthetic_script(seed=None, seconds=10.0, keys_per_second=5.0) -> List[Tuple[float, str]]:
+    # (seconds since the start, key), keys arrive at random like the presses of a player
+    generator = random.Random(seed)
+    script = []
+    at = generator.expovariate(keys_per_second)
+    while at < seconds:
+        script.append((at, generator.choice((KEY_LEFT, KEY_RIGHT, KEY_UP))))
+        at += generator.expovariate(keys_per_second)
+    return script
+
+
+class HeadlessDisplay:
+    # stands in for the renderer of a front-end: reads the cells it would draw, then takes `delay` seconds to show them
+    def __init__(self, game: Game, delay=0.0):
+        self.game = game
+        self.delay = delay
+        self.kinds = b''
+
+    def draw_game(self):
+        self.kinds = bytes(cell_kind(cell_value) for _, _, cell_value in self.game.traverse_visible_board_cells())
+        if self.delay:
+            sleep(self.delay)
+
+    def draw_snapshot(self, snapshot: FrameSnapshot):
+        self.kinds = snapshot.kinds
+        if self.delay:
+            sleep(self.delay)
+
+
+def trace_session(script: List[Tuple[float, str]], seed=None, max_x=16, max_y=16, seconds=10.0, threaded=False,
+                  render_delay=0.0, fps=100, max_render_fps=60, **schedule_options) -> dict:
+    # plays `script` in real time, the way pykret_pygame.py runs (or with `threaded`, its THREADED mode),
+    # for `seconds` or until the game ends, and reports the latencies of its keys
+    game = Game(max_x, max_y, seed=seed)
+    schedule = Schedule(game, fps=fps, **schedule_options)
+    display = HeadlessDisplay(game, render_delay)
+    tracer = InputTracer()
+    try:
+        if threaded:
+            game_over = run_threaded(schedule, display, tracer, script, seconds, max_render_fps)
+        else:
+            game_loop = GameLoop(schedule, render=display.draw_game, max_render_fps=max_render_fps)
+            tracer.instrument_loop(game_loop)
+            game_over = asyncio.run(game_loop.run(play_script(game_loop, script, seconds)))
+    finally:
+        tracer.disable()
+    return {
+        'seed': seed,
+        'threaded': threaded,
+        'game_over': game_over,
+        'frames': schedule.frame,
+        **tracer.report(),
+    }
+
+
+async def play_script(game_loop: GameLoop, script: List[Tuple[float, str]], seconds: float):
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    for at, key in script:
+        await asyncio.sleep(max(start + at - loop.time(), 0))
+        game_loop.press(key)
+    await asyncio.sleep(max(start + seconds - loop.time(), 0))
+    game_loop.stop()
+
+
+def run_threaded(schedule: Schedule, display: HeadlessDisplay, tracer: InputTracer, script: List[Tuple[float, str]],
+                 seconds: float, max_render_fps: int) -> bool:
+    # the main loop of the THREADED front-ends: input and drawing on this thread, polled every millisecond
+    simulation = SimulationThread(schedule)
+    tracer.instrument_simulation(simulation, display, 'draw_snapshot')
+    keys = deque(script)
+    drawn = None
+    next_draw_at = 0.0
+    simulation.start()
+    start = perf_counter()
+    while simulation.is_alive():
+        now = perf_counter() - start
+        while keys and keys[0][0] <= now:
+            simulation.press(keys.popleft()[1])
+        if now >= seconds:
+            simulation.stop()
+        if (snapshot := simulation.buffer.front) is not drawn and perf_counter() >= next_draw_at:
+            display.draw_snapshot(snapshot)
+            drawn = snapshot
+            next_draw_at = perf_counter() + 1 / max_render_fps
+        sleep(0.001)
+    simulation.join()
+    return simulation.game_over
@@ -0,0 +1,257 @@
+import argparse
+import json
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+from statistics import median
+from time import perf_counter
+from typing import Callable, Dict, List
+
+from engine.blocks import Block
+from engine.game import Game
+from engine.headless import parse_size
+
+SIZES = ['16x16', '32x16', '64x32', '256x256']
+SEED = 2024
+HISTORY_PATH = 'bench_history.jsonl'
+
+
+def new_game(size: str) -> Game:
+    return Game(*parse_size(size), seed=SEED)
+
+
+def board_blocks(game: Game) -> List[Block]:
+    return list({id(cell_value): cell_value for _, _, cell_value in game.board.traverse_all_board_cells()
+                 if isinstance(cell_value, Block)}.values())
+
+
+# every benchmark gets a board size and returns (seconds spent in the measured calls, number of calls)
+
+def bench_game_init(size: str):
+    start = perf_counter()
+    new_game(size)
+    return perf_counter() - start, 1
+
+
+def bench_next_iteration(size: str, ticks=200):
+    game = new_game(size)
+    spent = 0.0
+    for tick in range(ticks):
+        if tick % 6:
+            game.generate_new_block()
+        game.destroy_static_block()
+        start = perf_counter()
+        game.next_iteration()
+        spent += perf_counter() - start
+    return spent, ticks
+
+
+def bench_advance(size: str, ticks=1000):
+    game = new_game(size)
+    for _ in range(game.max_x // 4):
+        game.generate_new_block()
+    start = perf_counter()
+    game.advance(ticks)
+    return perf_counter() - start, 1
+
+
+def bench_can_block_be_moved(size: str):
+    game = new_game(size)
+    blocks = board_blocks(game)
+    can_block_be_moved = game.board.can_block_be_moved
+    start = perf_counter()
+    for block in blocks:
+        can_block_be_moved(block, 0, 1)
+        can_block_be_moved(block, 1, 0)
+        can_block_be_moved(block, -1, 0)
+    return perf_counter() - start, 3 * len(blocks)
+
+
+def bench_move_object(size: str):
+    # every block that can move is moved one cell and back, so the board stays the same
+    game = new_game(size)
+    board = game.board
+    moves = 0
+    spent = 0.0
+    for block in board_blocks(game):
+        for dx, dy in ((0, 1), (1, 0), (-1, 0), (0, -1)):
+            if board.can_block_be_moved(block, dx, dy):
+                start = perf_counter()
+                board.move_object(block, dx, dy)
+                board.move_object(block, -dx, -dy)
+                spent += perf_counter() - start
+                moves += 2
+                break
+    return spent, max(moves, 1)
+
+
+def bench_player_move_x(size: str, moves=200):
+    player = new_game(size).player
+    start = perf_counter()
+    for _ in range(moves // 2):
+        player.move_x(1)
+        player.move_x(-1)
+    return perf_counter() - start, moves
+
+
+def bench_player_move_y(size: str, moves=200):
+    player = new_game(size).player
+    start = perf_counter()
+    for _ in range(moves // 2):
+        player.move_y(-1)
+        player.move_y(1)
+    return perf_counter() - start, moves
+
+
+def bench_traverse_visible_board_cells(size: str):
+    game = new_game(size)
+    start = perf_counter()
+    for _ in game.traverse_visible_board_cells():
+        pass
+    return perf_counter() - start, 1
+
+
+def bench_snapshot_restore(size: str, repeats=100):
+    game = new_game(size)
+    start = perf_counter()
+    for _ in range(repeats):
+        game.restore(game.snapshot())
+    return perf_counter() - start, repeats
+
+
+def bench_apply_undo(size: str, repeats=100):
+    # a lookahead step of engine.autopilot: a key and an iteration, taken back
+    game = new_game(size)
+    player = game.player
+    start = perf_counter()
+    for repeat in range(repeats):
+        game.apply(player.move_x, 1 if repeat % 2 else -1)
+        game.apply(game.next_iteration)
+        game.undo()
+        game.undo()
+    return perf_counter() - start, repeats
+
+
+def bench_clone(size: str, repeats=20):
+    game = new_game(size)
+    start = perf_counter()
+    for _ in range(repeats):
+        game.clone()
+    return perf_counter() - start, repeats
+
+
+def bench_save(size: str, repeats=20):
+    game = new_game(size)
+    start = perf_counter()
+    for _ in range(repeats):
+        game.save()
+    return perf_counter() - start, repeats
+
+
+def bench_load(size: str, repeats=20):
+    data = new_game(size).save()
+    start = perf_counter()
+    for _ in range(repeats):
+        Game.load(data)
+    return perf_counter() - start, repeats
+
+
+BENCHMARKS: Dict[str, Callable] = {
+    'game_init': bench_game_init,
+    'next_iteration': bench_next_iteration,
+    'advance': bench_advance,
+    'can_block_be_moved': bench_can_block_be_moved,
+    'move_object': bench_move_object,
+    'player_move_x': bench_player_move_x,
+    'player_move_y': bench_player_move_y,
+    'traverse_visible_board_cells': bench_traverse_visible_board_cells,
+    'snapshot_restore': bench_snapshot_restore,
+    'apply_undo': bench_apply_undo,
+    'clone': bench_clone,
+    'save': bench_save,
+    'load': bench_load,
+}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names: List[str], sizes: List[str], repeats: int) -> dict:
+    results = {}
+    for name in names:
+        for size in sizes:
+            per_call = []
+            for _ in range(repeats):
+                spent, calls = BENCHMARKS[name](size)
+                per_call.append(spent / calls)
+            results[f'{name}[{size}]'] = {'median': median(per_call), 'min': min(per_call)}
+            print(f'{name:<30} {size:>8} {median(per_call) * 1e6:>14.2f} us', flush=True)
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'repeats': repeats,
+        'results': results,
+    }
+
+
+def load_history(path: str) -> List[dict]:
+    try:
+        with open(path) as file:
+            return [json.loads(line) for line in file if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def compare(old: dict, new: dict, threshold: float) -> bool:
+    # returns True when some benchmark got slower by more than `threshold` (0.1 means 10%)
+    regressed = False
+    print(f'{"benchmark":<42} {"old us":>12} {"new us":>12} {"change":>8}')
+    for key, result in new['results'].items():
+        if key not in old['results']:
+            continue
+        before, after = old['results'][key]['median'], result['median']
+        change = after / before - 1 if before else 0.0
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressed = True
+        print(f'{key:<42} {before * 1e6:>12.2f} {after * 1e6:>12.2f} {change:>+8.1%}{flag}')
+    return regressed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks of the engine hot paths.')
+    parser.add_argument('--history', default=HISTORY_PATH)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run benchmarks and append the results to the history')
+    run_parser.add_argument('--only', nargs='*', choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    run_parser.add_argument('--sizes', nargs='*', default=SIZES)
+    run_parser.add_argument('--repeats', type=int, default=5)
+
+    compare_parser = commands.add_parser('compare', help='compare two runs stored in the history')
+    compare_parser.add_argument('--old', type=int, default=-2, help='index of the baseline run (default: -2)')
+    compare_parser.add_argument('--new', type=int, default=-1, help='index of the compared run (default: -1)')
+    compare_parser.add_argument('--threshold', type=float, default=0.1)
+
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        entry = run(args.only, args.sizes, args.repeats)
+        with open(args.history, 'a') as history_file:
+            history_file.write(json.dumps(entry) + '\n')
+
+    if args.command == 'compare':
+        history = load_history(args.history)
+        if len(history) < 2:
+            sys.exit(f'Need at least two runs in {args.history} to compare.')
+        old_run, new_run = history[args.old], history[args.new]
+        print(f'{old_run["revision"]} ({old_run["timestamp"]}) -> {new_run["revision"]} ({new_run["timestamp"]})')
+        sys.exit(1 if compare(old_run, new_run, args.threshold) else 0)
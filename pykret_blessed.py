@@ -1,19 +1,33 @@
 # https://blessed.readthedocs.io/en/latest/
+import asyncio
+import sys
 from time import sleep
+from typing import Dict, Iterable, List, Tuple
 
 from blessed import Terminal
 
 from engine import blocks
-from engine.game import Game, GameEnd
+from engine.board import BLOCK_TYPES, EMPTY_CELL, PLAYER_CELL
+from engine.game import Game
+from engine.headless import AutopilotPolicy
+from engine.kinds import DirtyCells
+from engine.loop import GameLoop
 from engine.player import Player
+from engine.profiling import Profiler
+from engine.replay import Recorder
+from engine.schedule import Schedule
+from engine.threaded import FrameSnapshot, SimulationThread
+from engine.tracing import InputTracer
 
 
-def print_board(game: Game, term: Terminal, double_width=True, empty_char='.', **kwargs):
-    print(term.clear)
+class BoardPrinter:
+    # Remembers what is on the screen and only sends the cells and lines that changed since the last frame,
+    # everything in a single write. The whole screen is redrawn on the first frame and after a resize.
     BLOCK_CHAR = ' '
     BOTTOM_CHAR = '─'
-
-    char_width = 2 if double_width else 1
+    BOARD_TOP = 1
+    # Surprisingly, "rat" emoji takes two character spaces
+    PLAYER_STR = '🐀'
 
     color_dict = {
         blocks.SHorizontalBlock: 'green_reverse',
@@ -25,44 +39,107 @@ def print_board(game: Game, term: Terminal, double_width=True, empty_char='.', *
         blocks.VerticalLine4Block: 'blue_reverse',
     }
 
-    for x, y, cell_value in game.traverse_visible_board_cells():
-        cell_str = f'{cell_value}'
-        color = color_dict.get(type(cell_value))
-        if color:
-            cell_str = getattr(term, color)(BLOCK_CHAR) * char_width
+    def __init__(self, term: Terminal, double_width=True, empty_char='.'):
+        self.term = term
+        self.char_width = 2 if double_width else 1
+        self.empty_str = empty_char * self.char_width
+        self.block_strs = {block_type: getattr(term, color)(self.BLOCK_CHAR) * self.char_width
+                           for block_type, color in self.color_dict.items()}
+        self.kind_strs = {EMPTY_CELL: self.empty_str, PLAYER_CELL: self.PLAYER_STR,
+                          **{kind: self.block_strs.get(block_type, '#' * self.char_width)
+                             for kind, block_type in BLOCK_TYPES.items()}}
+        self.last_cells: List[str | None] = []
+        self.last_lines: Dict[int, str] = {}
+        self.last_size = None
+        # what changed since the last frame, of the game or of the snapshots
+        self.dirty = DirtyCells()
+
+    def cell_str(self, cell_value) -> str:
+        if cell_str := self.block_strs.get(type(cell_value)):
+            return cell_str
         elif cell_value is None:
-            cell_str = empty_char * char_width
+            return self.empty_str
         elif isinstance(cell_value, Player):
-            # Surprisingly, "rat" emoji takes two character spaces
-            cell_str = '🐀'
-
-        print(cell_str, end='')
-        if x == game.max_x - 1:
-            print()
-    print()
-
-    # draw bottom line
-    print(BOTTOM_CHAR * char_width * game.max_x)
-
-    print(f'blocks eaten: {game.blocks_eaten}')
-
-    if debug := kwargs.get('debug'):
-        print(f'frame:{debug["frame"]}, iteration:{game.current_iteration}')
-        print(f'fps_per_iteration: {debug["fps_per_iteration"]}')
-        print('You\'ve pressed ' + term.bold(repr(debug["last_keypress"])))
-
-
-def print_obituary(game: Game, double_width=True):
-    char_width = 2 if double_width else 1
-
-    print(term.move_up(10))
-    print(' ' * char_width * game.max_x)
-    print(game.obituary.center(char_width * game.max_x))
-    print(' ' * char_width * game.max_x)
-
-
-def calculate_new_frames_per_iteration(frames_per_iteration):
-    return frames_per_iteration // 2
+            return self.PLAYER_STR
+        return f'{cell_value}'
+
+    def status_lines(self, max_x: int, blocks_eaten: int, iteration: int, **kwargs) -> List[str]:
+        lines = [
+            '',
+            self.BOTTOM_CHAR * self.char_width * max_x,
+            f'blocks eaten: {blocks_eaten}',
+        ]
+        if debug := kwargs.get('debug'):
+            lines.append(f'frame:{debug["frame"]}, iteration:{iteration}')
+            lines.append(f'fps_per_iteration: {debug["fps_per_iteration"]}')
+            lines.append('You\'ve pressed ' + self.term.bold(repr(debug["last_keypress"])))
+        if profiler := kwargs.get('profiler'):
+            lines.extend(profiler.summary_lines())
+        return lines
+
+    def draw(self, game: Game, **kwargs):
+        rows = game.max_y - game.upper_lines
+        out = self.start_frame(game.max_x, rows)
+        self.draw_cells(out, game.max_x, ((x, y, self.cell_str(cell_value))
+                                          for x, y, cell_value in self.dirty.visible_cells(game)))
+        self.draw_status(out, rows, self.status_lines(game.max_x, game.blocks_eaten, game.current_iteration, **kwargs))
+        self.write(out)
+
+    def draw_snapshot(self, snapshot: FrameSnapshot, **kwargs):
+        # draws an engine.threaded snapshot, only the rows that differ from the last one are looked at
+        max_x, kinds = snapshot.max_x, snapshot.kinds
+        out = self.start_frame(max_x, snapshot.rows)
+        self.draw_cells(out, max_x, ((x, y, self.kind_strs[kind])
+                                     for x, y, kind in self.dirty.snapshot_cells(max_x, kinds)))
+        debug = {
+            'frame': snapshot.frame,
+            'last_keypress': snapshot.last_key,
+            'fps_per_iteration': snapshot.frames_per_iteration
+        }
+        self.draw_status(out, snapshot.rows, self.status_lines(max_x, snapshot.blocks_eaten, snapshot.iteration,
+                                                               debug=debug, **kwargs))
+        self.write(out)
+
+    def start_frame(self, max_x: int, rows: int) -> List[str]:
+        term = self.term
+        out = []
+        size = (term.width, term.height)
+        if size != self.last_size:
+            out.append(term.home + term.clear)
+            self.last_cells = [None] * (max_x * rows)
+            self.last_lines = {}
+            self.last_size = size
+            self.dirty.invalidate()
+        return out
+
+    def draw_cells(self, out: List[str], max_x: int, cells: Iterable[Tuple[int, int, str]]):
+        last_cells = self.last_cells
+        for x, y, cell_str in cells:
+            index = y * max_x + x
+            if last_cells[index] != cell_str:
+                last_cells[index] = cell_str
+                out.append(self.term.move_xy(x * self.char_width, self.BOARD_TOP + y) + cell_str)
+
+    def draw_status(self, out: List[str], rows: int, lines: List[str]):
+        for row, line in enumerate(lines, start=self.BOARD_TOP + rows):
+            if self.last_lines.get(row) != line:
+                self.last_lines[row] = line
+                out.append(self.term.move_xy(0, row) + line + self.term.clear_eol)
+
+    def write(self, out: List[str]):
+        if out:
+            sys.stdout.write(''.join(out))
+            sys.stdout.flush()
+
+    def draw_obituary(self, game: Game):
+        width = self.char_width * game.max_x
+        middle = self.BOARD_TOP + (game.max_y - game.upper_lines) // 2
+        lines = [' ' * width, game.obituary.center(width), ' ' * width]
+        sys.stdout.write(''.join(self.term.move_xy(0, row) + line for row, line in enumerate(lines, start=middle - 1))
+                         + self.term.move_xy(0, self.BOARD_TOP + game.max_y - game.upper_lines + 7))
+        sys.stdout.flush()
+        # the obituary overwrote some cells
+        self.last_size = None
 
 
 if __name__ == '__main__':
@@ -72,74 +149,96 @@ if __name__ == '__main__':
     MAX_X = 16
     MAX_Y = 16
     DOUBLE_WIDTH = True
+    RECORD_PATH = None  # e.g. 'last_game.kret', can be replayed with pykret_replay.py
+    AUTOPILOT = False  # demo mode, the game plays itself
+    PROFILE_PATH = None  # e.g. 'profile.json', shows engine timings under the board and saves them at the end
+    THREADED = False  # the game ticks on its own thread and the terminal draws its snapshots, however slow it is
+    TRACE_PATH = None  # e.g. 'trace.json', saves the latencies from key to drawn move and the frame pacing at the end
 
     game = Game(MAX_X, MAX_Y)
 
     GAME_SPEED_MULTIPLIER = 1
 
     FPS = 100
-    FRAMELENGTH = 1 / FPS
-
-    frames_per_iteration = FPS // GAME_SPEED_MULTIPLIER
-    frames_per_new_block = 6
-    frames_per_block_speed_change = 3 * frames_per_iteration
-    frames_until_player_fall = 100  # TODO: needs to be relative to iteration speed
-    last_up_movement_frame = 0
-    last_movement_frame = 0
 
-    frame = 0
-    print(term.clear)
-
-    last_keypress = None
-    refresh_needed = True
+    schedule = Schedule(game, fps=FPS, game_speed_multiplier=GAME_SPEED_MULTIPLIER)
+    recorder = Recorder(open(RECORD_PATH, 'wb'), schedule) if RECORD_PATH else None
+    printer = BoardPrinter(term, double_width=DOUBLE_WIDTH)
+    if not THREADED:
+        printer.dirty.follow(game.board.enable_changes())
+    profiler = Profiler() if PROFILE_PATH else None
+    if profiler:
+        profiler.instrument_game(game)
+        profiler.wrap(printer, 'draw_snapshot' if THREADED else 'draw', 'draw.blessed')
+
+    def render():
+        # changes made by keys since the last frame ended
+        game.board.changes.flush(schedule.frame)
+        debug = {
+            'frame': schedule.frame,
+            'last_keypress': game_loop.last_key,
+            'fps_per_iteration': schedule.frames_per_iteration
+        }
+        printer.draw(game, debug=debug, profiler=profiler)
+
+    game_loop = GameLoop(schedule, render=render, recorder=recorder)
+    tracer = InputTracer() if TRACE_PATH else None
+    if tracer and not THREADED:
+        tracer.instrument_loop(game_loop)
+
+    def read_keys():
+        # called by the event loop as soon as stdin has something to read
+        while inp := term.inkey(timeout=0):
+            game_loop.press(repr(inp))
+
+    async def autopilot():
+        policy = AutopilotPolicy()
+        while True:
+            if key := policy(game, schedule):
+                game_loop.press(key)
+            await asyncio.sleep(1 / FPS)
+
+    async def play():
+        loop = asyncio.get_running_loop()
+        with term.cbreak(), term.hidden_cursor():
+            loop.add_reader(sys.stdin.fileno(), read_keys)
+            try:
+                return await game_loop.run(*([autopilot()] if AUTOPILOT else []))
+            finally:
+                loop.remove_reader(sys.stdin.fileno())
+
+    def play_threaded():
+        simulation = SimulationThread(schedule, recorder=recorder, policy=AutopilotPolicy() if AUTOPILOT else None)
+        if tracer:
+            tracer.instrument_simulation(simulation, printer, 'draw_snapshot')
+        drawn = None
+        with term.cbreak(), term.hidden_cursor():
+            simulation.start()
+            try:
+                while simulation.is_alive():
+                    # waits for a key at most a frame, a key goes to the simulation right away
+                    if inp := term.inkey(timeout=1 / FPS):
+                        simulation.press(repr(inp))
+                    if (snapshot := simulation.buffer.front) is not drawn:
+                        printer.draw_snapshot(snapshot, profiler=profiler)
+                        drawn = snapshot
+            finally:
+                # the recorder is closed next, no key may be recorded after that
+                simulation.stop()
+                simulation.join()
+        return simulation.game_over
 
     try:
-        while True:
-            if refresh_needed:
-                debug = {
-                    'frame': frame,
-                    'last_keypress': last_keypress,
-                    'fps_per_iteration': frames_per_iteration
-                }
-                print_board(game, term, double_width=DOUBLE_WIDTH, debug=debug)
-                refresh_needed = False
-
-            frame += 1
-            sleep(FRAMELENGTH)
-
-            if game.player.is_dead():
-                raise GameEnd()
-
-            if (frame - last_movement_frame) % frames_per_iteration == 0:
-                if (frame // frames_per_iteration) % frames_per_new_block:
-                    game.generate_new_block()
-                game.destroy_static_block()
-                game.next_iteration()
-                refresh_needed = True
-
-            if (frame - last_up_movement_frame) % frames_until_player_fall == 0:
-                game.player.move_y(1)
-                refresh_needed = True
-
-            with term.cbreak(), term.hidden_cursor():
-                inp = term.inkey(timeout=FRAMELENGTH)
-                if inp:
-                    if repr(inp) == 'KEY_RIGHT':
-                        game.player.move_x(1)
-                    if repr(inp) == 'KEY_LEFT':
-                        game.player.move_x(-1)
-                    if repr(inp) == 'KEY_UP':
-                        game.player.move_y(-1)
-                        last_up_movement_frame = frame
-                    last_keypress = repr(inp)
-                    refresh_needed = True
-                    last_movement_frame = frame + 1  # That's tricky, because it will force the next iteration
-
-            if frame % frames_per_block_speed_change == 0:
-                new_frames_per_iteration = calculate_new_frames_per_iteration(frames_per_iteration)
-                if new_frames_per_iteration > 0:
-                    frames_per_iteration = new_frames_per_iteration
-
-    except GameEnd:
-        print_obituary(game, double_width=DOUBLE_WIDTH)
+        game_over = play_threaded() if THREADED else asyncio.run(play())
+    finally:
+        # also when quit with ctrl-c, the recording then ends in the frame the game was left
+        if recorder:
+            recorder.close()
+            recorder.file.close()
+    if profiler:
+        profiler.dump(PROFILE_PATH)
+    if tracer:
+        tracer.dump(TRACE_PATH)
+    if game_over:
+        printer.draw_obituary(game)
         sleep(10)
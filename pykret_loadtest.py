@@ -0,0 +1,123 @@
+import argparse
+import asyncio
+import json
+import random
+from time import perf_counter
+from typing import List
+
+from engine.replay import KEY_CODES
+from engine.server import (BOARD, DELTA, DELTA_HEADER, END, KEY, LENGTH, PLAY, WATCH, WATCH_BODY, decode_board,
+                           frame, read_message)
+
+
+class Stats:
+    def __init__(self):
+        self.bytes = 0
+        self.messages = 0
+        self.ticks = 0  # frames the watched games advanced, summed over all clients
+        self.resyncs = 0
+        self.games_ended = 0
+        self.failed_connections = 0
+        self.sessions: List[int] = []
+
+
+async def watch_game(host: str, port: int, stats: Stats, hello: bytes, rng: random.Random, keys_per_second=0.0):
+    # one connection until its game ends; a player presses random keys, a spectator only reads
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        stats.failed_connections += 1
+        return
+
+    async def press_keys():
+        codes = list(KEY_CODES.values())
+        while True:
+            await asyncio.sleep(rng.expovariate(keys_per_second))
+            writer.write(frame(bytes((KEY, rng.choice(codes)))))
+
+    writer.write(frame(hello))
+    keys = asyncio.ensure_future(press_keys()) if keys_per_second else None
+    last_tick = None
+    try:
+        while True:
+            body = await read_message(reader)
+            stats.bytes += LENGTH.size + len(body)
+            stats.messages += 1
+            if body[0] == DELTA:
+                tick = DELTA_HEADER.unpack_from(body)[1]
+            elif body[0] == BOARD:
+                session_id, tick, *_ = decode_board(body)
+                if last_tick is None:
+                    if hello[0] == PLAY:
+                        stats.sessions.append(session_id)
+                else:
+                    stats.resyncs += 1
+            elif body[0] == END:
+                stats.games_ended += 1
+                break
+            else:
+                continue
+            if last_tick is not None:
+                stats.ticks += tick - last_tick
+            last_tick = tick
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        if keys:
+            keys.cancel()
+        writer.close()
+
+
+async def player(host: str, port: int, stats: Stats, rng: random.Random, keys_per_second: float):
+    # starts a new game whenever the last one ended, so the number of hosted games stays the same
+    while True:
+        await watch_game(host, port, stats, bytes((PLAY,)), rng, keys_per_second)
+
+
+async def load_test(host: str, port: int, players: int, spectators: int, seconds: float, keys_per_second: float,
+                    seed: int) -> dict:
+    rng = random.Random(seed)
+    stats = Stats()
+    tasks = [asyncio.ensure_future(player(host, port, stats, random.Random(rng.random()), keys_per_second))
+             for _ in range(players)]
+    while players and not stats.sessions and stats.failed_connections < players:
+        await asyncio.sleep(0.01)
+    # spectators watch the first games of the players
+    for i in range(spectators if stats.sessions else 0):
+        hello = WATCH_BODY.pack(WATCH, stats.sessions[i % len(stats.sessions)])
+        tasks.append(asyncio.ensure_future(watch_game(host, port, stats, hello, rng)))
+
+    stats.bytes = stats.messages = stats.ticks = 0
+    start = perf_counter()
+    await asyncio.sleep(seconds)
+    elapsed = perf_counter() - start
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    return {
+        'players': players,
+        'spectators': spectators,
+        'seconds': elapsed,
+        'ticks_per_second': stats.ticks / elapsed,
+        'messages_per_second': stats.messages / elapsed,
+        'bytes_per_second': stats.bytes / elapsed,
+        'resyncs': stats.resyncs,
+        'games_ended': stats.games_ended,
+        'failed_connections': stats.failed_connections,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Open many connections to pykret_server.py and measure throughput.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--players', type=int, default=100)
+    parser.add_argument('--spectators', type=int, default=0)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--keys-per-second', type=float, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(load_test(args.host, args.port, args.players, args.spectators, args.seconds,
+                                           args.keys_per_second, args.seed)), indent=2))
@@ -0,0 +1,20 @@
+import argparse
+from time import perf_counter
+
+from engine.headless import parse_size
+from engine.pool import write_pool
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Prebuild the starting boards of seeded games.')
+    parser.add_argument('--size', action='append', help='board size, e.g. 64x32, may be given more than once')
+    parser.add_argument('--seed', type=int, default=0, help='first seed')
+    parser.add_argument('--games', type=int, default=1000, help='boards per size, seeds seed, seed+1, ...')
+    parser.add_argument('--output', default='boards.krp')
+    args = parser.parse_args()
+
+    sizes = [parse_size(size) for size in args.size or ['16x16']]
+    start = perf_counter()
+    with open(args.output, 'wb') as output:
+        write_pool(output, sizes, range(args.seed, args.seed + args.games))
+    print(f'{len(sizes) * args.games} boards in {perf_counter() - start:.1f}s')
@@ -1,16 +1,24 @@
+import asyncio
 from dataclasses import dataclass
+from time import perf_counter, sleep
+from typing import Iterable, List, Tuple
 
 import pygame
 from pygame import Rect
 from engine import blocks
+from engine.board import BLOCK_TYPES, EMPTY_CELL, PLAYER_CELL
 from engine.player import Player
-from engine.game import Game, GameEnd
+from engine.game import Game
+from engine.kinds import DirtyCells
+from engine.loop import GameLoop
+from engine.profiling import Profiler
+from engine.schedule import KEY_LEFT, KEY_RIGHT, KEY_UP, Schedule
+from engine.threaded import FrameSnapshot, SimulationThread
+from engine.tracing import InputTracer
 
 pygame.init()
 
-clock = pygame.time.Clock()
 running = True
-dt = 0
 
 
 @dataclass
@@ -20,12 +28,30 @@ class Offset:
 
 
 class Renderer:
+    # Cells are blitted from pre-rendered tiles and only the cells that changed since the last frame
+    # (plus the score) are pushed to the display. The whole screen is drawn on the first frame only.
+    board_border = 5
+
     def __init__(self, game: Game, unit: int):
         self.game = game
         self.unit = unit
+        self.offset = Offset(x=1, y=1)
         self.screen_x = (game.max_x + 2) * self.unit
         self.screen_y = (game.max_y - game.upper_lines + 2) * self.unit
         self.screen = pygame.display.set_mode((self.screen_x, self.screen_y))
+        self.font = pygame.font.Font('freesansbold.ttf', 24)
+
+        self.tiles = {color: self.make_block_tile(color) for color in set(self.color_dict.values())}
+        self.tiles['player'] = self.make_player_tile()
+        self.tiles[None] = self.make_empty_tile()
+        self.kind_tiles = {EMPTY_CELL: None, PLAYER_CELL: 'player',
+                           **{kind: self.color_dict.get(block_type) for kind, block_type in BLOCK_TYPES.items()}}
+
+        self.last_cells: List[str | None] | None = None
+        self.last_text = None
+        self.last_text_rect: Rect | None = None
+        # what changed since the last frame, of the game or of the snapshots
+        self.dirty = DirtyCells()
 
     color_dict = {
         blocks.SHorizontalBlock: 'green',
@@ -37,62 +63,110 @@ class Renderer:
         blocks.VerticalLine4Block: 'blue',
     }
 
-    def draw_block(self, x, y, color="black"):
+    def make_empty_tile(self) -> pygame.Surface:
+        tile = pygame.Surface((self.unit, self.unit))
+        tile.fill("lightblue")
+        return tile
+
+    def make_block_tile(self, color) -> pygame.Surface:
+        tile = pygame.Surface((self.unit, self.unit))
         # center
-        pygame.draw.rect(self.screen, color, Rect(x * self.unit, y * self.unit, self.unit, self.unit))
-        # outline
-        # pygame.draw.rect(self.screen, "black", Rect(x * self.unit, y * self.unit, self.unit, self.unit))
+        tile.fill(color)
         # outline left top
-        pygame.draw.line(self.screen, "black", (x * self.unit, y * self.unit), ((x+1) * self.unit - 1, y * self.unit))
-        pygame.draw.line(self.screen, "black", (x * self.unit, y * self.unit), (x * self.unit, (y+1) * self.unit))
+        pygame.draw.line(tile, "black", (0, 0), (self.unit - 1, 0))
+        pygame.draw.line(tile, "black", (0, 0), (0, self.unit))
+        return tile
+
+    def make_player_tile(self) -> pygame.Surface:
+        tile = self.make_empty_tile()
+        pygame.draw.circle(tile, "black", (self.unit // 2, self.unit // 2), self.unit // 2)
+        return tile
 
-    def draw_player(self, x, y):
-        pygame.draw.circle(self.screen, "black", (x * self.unit + self.unit // 2, y * self.unit + self.unit // 2),
-                           self.unit // 2)
+    def cell_rect(self, x, y) -> Rect:
+        return Rect((x + self.offset.x) * self.unit, (y + self.offset.y) * self.unit, self.unit, self.unit)
 
-    def draw_text(self, x, y, text: str):
-        font = pygame.font.Font('freesansbold.ttf', 24)
-        text = font.render(text, True, pygame.color.THECOLORS['black'], pygame.color.THECOLORS['white'])
+    def draw_text(self, x, y, text: str) -> Rect:
+        text = self.font.render(text, True, pygame.color.THECOLORS['black'], pygame.color.THECOLORS['white'])
         text_rect = text.get_rect()
         text_rect.topleft = (x, y)
         self.screen.blit(text, text_rect)
+        return text_rect
 
-    def draw_game(self):
+    def draw_background(self):
         self.screen.fill("white")
-        offset = Offset(x=1, y=1)
-
-        board_border = 5
         pygame.draw.rect(self.screen,
                          "lightblue",
                          Rect(
-                             offset.x * self.unit - board_border,
-                             offset.y * self.unit - board_border,
-                             self.game.max_x * self.unit + board_border * 2,
-                             (self.game.max_y - self.game.upper_lines) * self.unit + board_border * 2)
+                             self.offset.x * self.unit - self.board_border,
+                             self.offset.y * self.unit - self.board_border,
+                             self.game.max_x * self.unit + self.board_border * 2,
+                             (self.game.max_y - self.game.upper_lines) * self.unit + self.board_border * 2)
                          )
 
-        for x, y, cell_value in game.traverse_visible_board_cells():
-            x = x + offset.x
-            y = y + offset.y
-            color = self.color_dict.get(type(cell_value))
-            if color:
-                self.draw_block(x, y, color)
-            elif cell_value is None:
-                pass
-            elif isinstance(cell_value, Player):
-                self.draw_player(x, y)
-
-        message = f'blocks eaten: {game.blocks_eaten}'
-        self.draw_text(self.unit, 8, message)
+    def tile_key(self, cell_value) -> str | None:
+        tile_key = self.color_dict.get(type(cell_value))
+        if tile_key is None and isinstance(cell_value, Player):
+            tile_key = 'player'
+        return tile_key
+
+    def start_frame(self) -> bool:
+        full_redraw = self.last_cells is None
+        if full_redraw:
+            self.draw_background()
+            self.last_cells = [None] * (self.game.max_x * (self.game.max_y - self.game.upper_lines))
+            self.last_text = None
+            self.dirty.invalidate()
+        return full_redraw
+
+    def draw_cells(self, cells: Iterable[Tuple[int, int, str | None]], full_redraw: bool) -> List[Rect]:
+        dirty_rects = []
+        last_cells = self.last_cells
+        for x, y, tile_key in cells:
+            index = y * self.game.max_x + x
+            if full_redraw or last_cells[index] != tile_key:
+                last_cells[index] = tile_key
+                rect = self.cell_rect(x, y)
+                self.screen.blit(self.tiles[tile_key], rect)
+                dirty_rects.append(rect)
+        return dirty_rects
+
+    def finish_frame(self, blocks_eaten: int, dirty_rects: List[Rect], full_redraw: bool):
+        message = f'blocks eaten: {blocks_eaten}'
+        if message != self.last_text:
+            if self.last_text_rect:
+                self.screen.fill("white", self.last_text_rect)
+                dirty_rects.append(self.last_text_rect)
+            self.last_text_rect = self.draw_text(self.unit, 8, message)
+            self.last_text = message
+            dirty_rects.append(self.last_text_rect)
+
+        if full_redraw:
+            pygame.display.flip()
+        elif dirty_rects:
+            pygame.display.update(dirty_rects)
 
-        pygame.display.flip()
+    def draw_game(self):
+        full_redraw = self.start_frame()
+        dirty_rects = self.draw_cells(((x, y, self.tile_key(cell_value))
+                                       for x, y, cell_value in self.dirty.visible_cells(self.game)), full_redraw)
+        self.finish_frame(self.game.blocks_eaten, dirty_rects, full_redraw)
+
+    def draw_snapshot(self, snapshot: FrameSnapshot):
+        # draws an engine.threaded snapshot, only the rows that differ from the last one are looked at
+        full_redraw = self.start_frame()
+        dirty_rects = self.draw_cells(((x, y, self.kind_tiles[kind])
+                                       for x, y, kind in self.dirty.snapshot_cells(snapshot.max_x, snapshot.kinds)),
+                                      full_redraw)
+        self.finish_frame(snapshot.blocks_eaten, dirty_rects, full_redraw)
 
     def draw_obituary(self):
-        font = pygame.font.Font('freesansbold.ttf', 24)
-        text = font.render(self.game.obituary, True, pygame.color.THECOLORS['black'], pygame.color.THECOLORS['white'])
+        text = self.font.render(self.game.obituary, True, pygame.color.THECOLORS['black'],
+                                pygame.color.THECOLORS['white'])
         textRect = text.get_rect()
         textRect.center = (self.screen_x // 2, self.screen_y // 2)
         self.screen.blit(text, textRect)
+        # the obituary covers some cells
+        self.last_cells = None
 
 
 # regular
@@ -107,57 +181,88 @@ renderer = Renderer(game, unit=50)
 # game = Game(64, 32)
 # renderer = Renderer(game, unit=30)
 
-frame = 0
-
 FPS = 100
-FRAMELENGTH = 1 / FPS
 GAME_SPEED_MULTIPLIER = 1
-
-frames_per_iteration = FPS // GAME_SPEED_MULTIPLIER
-frames_per_new_block = 6
-frames_until_player_fall = 100  # TODO: needs to be relative to iteration speed
-last_up_movement_frame = 0
-last_movement_frame = 0
-
-try:
-    while running:
-        frame += 1
-
-        if game.player.is_dead():
-            raise GameEnd()
-
+PROFILE_PATH = None  # e.g. 'profile.json', engine and draw timings are saved there at the end
+THREADED = False  # the game ticks on its own thread, a slow display cannot hold it up
+MAX_RENDER_FPS = 60
+TRACE_PATH = None  # e.g. 'trace.json', the latencies from key to drawn move and the frame pacing are saved there
+
+profiler = Profiler() if PROFILE_PATH else None
+if profiler:
+    profiler.instrument_game(game)
+    profiler.wrap(renderer, 'draw_snapshot' if THREADED else 'draw_game', 'draw.pygame')
+
+KEYS = {
+    pygame.K_w: KEY_UP,
+    pygame.K_UP: KEY_UP,
+    pygame.K_a: KEY_LEFT,
+    pygame.K_LEFT: KEY_LEFT,
+    pygame.K_d: KEY_RIGHT,
+    pygame.K_RIGHT: KEY_RIGHT,
+}
+
+schedule = Schedule(game, fps=FPS, game_speed_multiplier=GAME_SPEED_MULTIPLIER)
+if not THREADED:
+    renderer.dirty.follow(game.board.enable_changes())
+
+
+def render():
+    # changes made by keys since the last frame ended
+    game.board.changes.flush(schedule.frame)
+    renderer.draw_game()
+
+
+game_loop = GameLoop(schedule, render=render, max_render_fps=MAX_RENDER_FPS)
+tracer = InputTracer() if TRACE_PATH else None
+if tracer and not THREADED:
+    tracer.instrument_loop(game_loop)
+
+
+async def poll_events():
+    # pygame has no awaitable events, so they are polled much more often than frames are drawn
+    global running
+    while True:
         for event in pygame.event.get():
-            if event.type == pygame.QUIT:
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_q):
                 running = False
-            if event.type == pygame.KEYDOWN:
-                if event.key in (pygame.K_w, pygame.K_UP):
-                    game.player.move_y(-1)
-                    last_movement_frame = frame + 1
-                    last_up_movement_frame = frame - 1  # TODO: fix that
-                if event.key in (pygame.K_a, pygame.K_LEFT):
-                    game.player.move_x(-1)
-                    last_movement_frame = frame + 1
-                if event.key in (pygame.K_d, pygame.K_RIGHT):
-                    game.player.move_x(1)
-                    last_movement_frame = frame + 1
-                if event.key == pygame.K_q:
-                    running = False
-
-        if (frame - last_movement_frame) % frames_per_iteration == 0:
-            if (frame // frames_per_iteration) % frames_per_new_block:
-                game.generate_new_block()
-            game.destroy_static_block()
-            game.next_iteration()
-            refresh_needed = True
-
-        if (frame - last_up_movement_frame) % frames_until_player_fall == 0:
-            game.player.move_y(1)
-            refresh_needed = True
-
-        renderer.draw_game()
-        dt = clock.tick(60) / 1000
-
-except GameEnd:
+                game_loop.stop()
+            elif event.type == pygame.KEYDOWN and event.key in KEYS:
+                game_loop.press(KEYS[event.key])
+        await asyncio.sleep(0.001)
+
+
+def play_threaded() -> bool:
+    # events and the display stay on the main thread, which only ever draws the latest published snapshot
+    global running
+    simulation = SimulationThread(schedule)
+    if tracer:
+        tracer.instrument_simulation(simulation, renderer, 'draw_snapshot')
+    simulation.start()
+    drawn = None
+    next_draw_at = 0.0
+    while simulation.is_alive():
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_q):
+                running = False
+                simulation.stop()
+            elif event.type == pygame.KEYDOWN and event.key in KEYS:
+                simulation.press(KEYS[event.key])
+        if (snapshot := simulation.buffer.front) is not drawn and perf_counter() >= next_draw_at:
+            renderer.draw_snapshot(snapshot)
+            drawn = snapshot
+            next_draw_at = perf_counter() + 1 / MAX_RENDER_FPS
+        sleep(0.001)
+    return simulation.game_over
+
+
+game_over = play_threaded() if THREADED else asyncio.run(game_loop.run(poll_events()))
+if profiler:
+    profiler.dump(PROFILE_PATH)
+if tracer:
+    tracer.dump(TRACE_PATH)
+
+if game_over:
     renderer.draw_obituary()
     pygame.display.flip()
 
@@ -0,0 +1,42 @@
+import argparse
+import cProfile
+import pstats
+from time import perf_counter
+
+from engine.history import HistoryRecorder
+from engine.replay import Replay
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Re-execute a recorded game as fast as possible.')
+    parser.add_argument('recording')
+    parser.add_argument('--profile', action='store_true', help='print the hottest functions of the run')
+    parser.add_argument('--history', help='also write every frame of the run to this history file')
+    args = parser.parse_args()
+
+    replay = Replay.load(args.recording)
+    profiler = cProfile.Profile() if args.profile else None
+    history: HistoryRecorder | None = None
+
+    def record_history(schedule):
+        global history
+        if history is None:
+            history = HistoryRecorder(open(args.history, 'wb'), schedule.game)
+        history.record()
+
+    start = perf_counter()
+    if profiler:
+        profiler.enable()
+    game = replay.run(on_frame=record_history if args.history else None)
+    if profiler:
+        profiler.disable()
+    elapsed = perf_counter() - start
+    if history:
+        history.close()
+        history.file.close()
+
+    print(f'board: {replay.max_x}x{replay.max_y}, seed: {replay.seed}, inputs: {len(replay.inputs)}')
+    print(f'frames: {replay.last_frame}, iterations: {game.current_iteration}, blocks eaten: {game.blocks_eaten}')
+    print(f'replayed in {elapsed:.3f}s ({elapsed / max(game.current_iteration, 1) * 1000:.3f}ms per iteration)')
+
+    if profiler:
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
@@ -0,0 +1,29 @@
+import argparse
+import asyncio
+
+from engine.headless import parse_size
+from engine.pool import BoardPool
+from engine.server import GameServer
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Host games for remote players and spectators.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--size', default='16x16', help='board size, e.g. 64x32')
+    parser.add_argument('--seed', type=int, default=None, help='game of session n gets seed+n')
+    parser.add_argument('--fps', type=int, default=100)
+    parser.add_argument('--speed', type=int, default=1, help='game speed multiplier')
+    parser.add_argument('--max-buffer', type=int, default=1 << 16,
+                        help='bytes a client may lag behind before its ticks are dropped')
+    parser.add_argument('--pool', default=None, help='prebuilt starting boards, see pykret_pool.py')
+    args = parser.parse_args()
+
+    max_x, max_y = parse_size(args.size)
+    pool = BoardPool(args.pool) if args.pool else None
+    server = GameServer(max_x, max_y, seed=args.seed, fps=args.fps, max_buffer=args.max_buffer, pool=pool,
+                        game_speed_multiplier=args.speed)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
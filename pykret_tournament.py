@@ -0,0 +1,61 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from statistics import mean, median
+from time import perf_counter
+
+from engine.headless import POLICIES, parse_size, run_session
+
+
+def summarize(results):
+    iterations = [r['iterations'] for r in results]
+    eaten = [r['blocks_eaten'] for r in results]
+    per_iteration = [r['seconds_per_iteration'] for r in results if r['seconds_per_iteration']]
+    return {
+        'games': len(results),
+        'died': sum(r['died'] for r in results),
+        'iterations_mean': mean(iterations),
+        'iterations_median': median(iterations),
+        'blocks_eaten_mean': mean(eaten),
+        'blocks_eaten_median': median(eaten),
+        'seconds_per_iteration_mean': mean(per_iteration) if per_iteration else None,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run many headless games across all cores.')
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--policy', default='random',
+                        help=f'one of {", ".join(POLICIES)} or module:callable taking a seed')
+    parser.add_argument('--size', default='16x16', help='board size, e.g. 64x32')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first game, next games use seed+1, ...')
+    parser.add_argument('--max-frames', type=int, default=100_000)
+    parser.add_argument('--fps', type=int, default=100)
+    parser.add_argument('--speed', type=int, default=1, help='game speed multiplier')
+    parser.add_argument('--output', default='tournament.jsonl')
+    parser.add_argument('--profile', action='store_true', help='add engine timings and counters to every result')
+    parser.add_argument('--check', action='store_true', help='verify every board after every frame, slow')
+    args = parser.parse_args()
+
+    max_x, max_y = parse_size(args.size)
+    results = []
+    start = perf_counter()
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor, open(args.output, 'w') as output:
+        futures = [executor.submit(run_session, args.policy, args.seed + i, max_x, max_y, args.max_frames,
+                                   profile=args.profile, check=args.check, fps=args.fps,
+                                   game_speed_multiplier=args.speed)
+                   for i in range(args.games)]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            output.write(json.dumps(result) + '\n')
+            output.flush()
+
+        summary = summarize(results)
+        summary['wall_seconds'] = perf_counter() - start
+        output.write(json.dumps({'summary': summary}) + '\n')
+
+    print(json.dumps(summary, indent=2))
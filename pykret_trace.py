@@ -0,0 +1,35 @@
+import argparse
+import json
+import sys
+
+from engine.headless import parse_size
+from engine.tracing import report_lines, synthetic_script, trace_session
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Play scripted keys in real time without a display and report '
+                                                 'the input-to-display latency and the frame pacing.')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the game and of the keys')
+    parser.add_argument('--size', default='16x16', help='board size, e.g. 64x32')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--keys-per-second', type=float, default=5.0)
+    parser.add_argument('--threaded', action='store_true', help='run the game on its own thread, see engine.threaded')
+    parser.add_argument('--render-delay', type=float, default=0.0, help='milliseconds every drawn frame takes')
+    parser.add_argument('--fps', type=int, default=100)
+    parser.add_argument('--max-render-fps', type=int, default=60)
+    parser.add_argument('--output', help='save the report as json')
+    parser.add_argument('--max-p99', type=float, help='exit with 1 when the p99 input-to-display latency (ms) is over')
+    args = parser.parse_args()
+
+    max_x, max_y = parse_size(args.size)
+    result = trace_session(synthetic_script(args.seed, args.seconds, args.keys_per_second), seed=args.seed,
+                           max_x=max_x, max_y=max_y, seconds=args.seconds, threaded=args.threaded,
+                           render_delay=args.render_delay / 1000, fps=args.fps, max_render_fps=args.max_render_fps)
+    print(f'frames {result["frames"]}{", game over" if result["game_over"] else ""}')
+    print('\n'.join(report_lines(result)))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(result, output, indent=2)
+    if args.max_p99 is not None and result['input_to_display']['p99_ms'] > args.max_p99:
+        print(f'p99 input-to-display latency is over {args.max_p99} ms')
+        sys.exit(1)